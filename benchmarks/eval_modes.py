@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+from benchmarks.generate import generate_resumes
+from benchmarks.run import criteria as default_criteria, get_git_commit, start_fake_server
+
+# Evaluation of the scoring modes. The same resumes are scored once in every mode with the same criteria headers,
+# then every mode is compared to the first one (the reference, reflective by default): agreement of the scores per
+# criterion, rank correlation of the total scores and overlap of the top candidates, along with the time, the
+# model calls and the tokens each mode used. Caches and the score store are turned off, so every mode does the full work.
+# The cascade scoring can be evaluated too, as the cascade mode, with --top-k as its cutoff.
+
+# function to score the resumes in a mode, returns the scores along with the time, calls and tokens it took
+# the cascade mode is the cascade scoring in the default scoring mode, its tiers are reported as well
+async def score_in_mode(contents: List[str], criteria_headers: dict, batch_size: int, scoring_mode: str, top_k: int) -> dict:
+    from utils.helpers import get_all_candidate_scores, get_cascade_scores
+    from utils.metrics import RequestTrace
+
+    tiers = None
+    trace = RequestTrace(f"eval {scoring_mode}")
+    with trace.activate():
+        start = time.perf_counter()
+        if scoring_mode == "cascade":
+            scores, tiers = await get_cascade_scores(contents, criteria_headers, batch_size, top_k=top_k)
+        else:
+            scores = await get_all_candidate_scores(contents, criteria_headers, batch_size, scoring_mode)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "scores": scores,
+        "tiers": [tier.model_dump() for tier in tiers] if tiers is not None else None,
+        "seconds": elapsed,
+        "llm_calls": sum(trace.calls.values()),
+        "retries": sum(trace.retries.values()),
+        "prompt_tokens": sum(count for name, count in trace.tokens.items() if name.endswith("_prompt")),
+        "completion_tokens": sum(count for name, count in trace.tokens.items() if name.endswith("_completion"))
+    }
+
+# table of the scores of a mode, one row per resume (failed resumes are left empty) and one column per header
+def get_score_frame(scores: list, headers: List[str]) -> pd.DataFrame:
+    rows = [{header: None for header in headers} if result.Candidate_Name == "Error" else {header: result.scores.get(header) for header in headers}
+            for result in scores]
+    return pd.DataFrame(rows, columns=headers, dtype="float")
+
+# function to compare the scores of a mode to the reference scores, on the resumes scored in both modes
+def compare_scores(reference: pd.DataFrame, scores: pd.DataFrame, top_k: int) -> dict:
+
+    valid = reference.notna().all(axis=1) & scores.notna().all(axis=1)
+    reference, scores = reference[valid], scores[valid]
+    if len(reference) == 0:
+        return {"compared": 0}
+
+    differences = (scores - reference).abs()
+    reference_totals, totals = reference.sum(axis=1), scores.sum(axis=1)
+
+    # top candidates of both modes, ties are broken on the resume order
+    top = min(top_k, len(reference))
+    reference_top = set(reference_totals.sort_values(ascending=False, kind="stable").index[:top])
+    mode_top = set(totals.sort_values(ascending=False, kind="stable").index[:top])
+
+    return {
+        "compared": int(len(reference)),
+        "exact_agreement": float((differences == 0).to_numpy().mean()),
+        "within_one": float((differences <= 1).to_numpy().mean()),
+        "mean_absolute_difference": float(differences.to_numpy().mean()),
+        "per_criterion_mean_absolute_difference": {header: float(value) for header, value in differences.mean().items()},
+        "total_spearman": float(reference_totals.corr(totals, method="spearman")) if len(reference) > 1 else None,
+        "top_k_overlap": len(reference_top & mode_top) / top
+    }
+
+def format_number(value, digits: int = 3) -> str:
+    return "-" if value is None or (isinstance(value, float) and np.isnan(value)) else f"{value:.{digits}f}"
+
+def print_report(report: dict):
+
+    print(f"\nCommit {report['commit']}, {report['resumes']} resumes, {len(report['criteria'])} criteria, batch size {report['batch_size']}, "
+          f"compared to {report['reference']}")
+    print(f"{'mode':<12}{'seconds':>9}{'calls':>7}{'retries':>9}{'failed':>8}{'prompt tok':>12}{'compl tok':>11}"
+          f"{'exact %':>9}{'±1 %':>7}{'MAD':>7}{'spearman':>10}{'top-k %':>9}")
+
+    for result in report["modes"]:
+        comparison = result["comparison"]
+        print(f"{result['mode']:<12}{result['seconds']:>9.2f}{result['llm_calls']:>7}{result['retries']:>9}{result['failed']:>8}"
+              f"{result['prompt_tokens']:>12}{result['completion_tokens']:>11}"
+              f"{format_number(100 * comparison['exact_agreement'] if 'exact_agreement' in comparison else None, 1):>9}"
+              f"{format_number(100 * comparison['within_one'] if 'within_one' in comparison else None, 1):>7}"
+              f"{format_number(comparison.get('mean_absolute_difference'), 2):>7}"
+              f"{format_number(comparison.get('total_spearman')):>10}"
+              f"{format_number(100 * comparison['top_k_overlap'] if 'top_k_overlap' in comparison else None, 1):>9}")
+        for tier in result["tiers"] or []:
+            print(f"{'':<12}tier {tier['tier']} {tier['model']}: {tier['resumes']} resumes, {tier['llm_calls']} calls")
+
+async def evaluate(args, resume_paths: List[str], criteria: List[str]) -> dict:
+    from utils.helpers import extract_content_from_path, compact_resume_text, get_criteria_headers
+
+    extracted = await asyncio.gather(*[extract_content_from_path(os.path.splitext(path)[1].lower(), path) for path in resume_paths])
+    contents = [compact_resume_text(text_content)[0] for text_content in extracted if text_content is not None]
+    print(f"{len(contents)} out of {len(resume_paths)} resumes extracted")
+
+    # every mode is given the same headers, so their scores can be compared column by column
+    headers_response = await get_criteria_headers(criteria)
+    if "Error" in headers_response.criteria_headers:
+        raise SystemExit("Failed to generate criteria headers")
+    criteria_headers = headers_response.criteria_headers
+    headers = list(criteria_headers.values())
+
+    results = []
+    frames: Dict[str, pd.DataFrame] = {}
+    for scoring_mode in args.modes.split(","):
+        print(f"Scoring in {scoring_mode} mode")
+        result = await score_in_mode(contents, criteria_headers, args.batch_size, scoring_mode, args.top_k)
+        frames[scoring_mode] = get_score_frame(result.pop("scores"), headers)
+        result["mode"] = scoring_mode
+        result["failed"] = int(frames[scoring_mode].isna().any(axis=1).sum())
+        results.append(result)
+
+    reference = results[0]["mode"]
+    for result in results:
+        result["comparison"] = compare_scores(frames[reference], frames[result["mode"]], args.top_k)
+
+    return {
+        "commit": get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "resumes": len(contents),
+        "criteria": criteria,
+        "batch_size": args.batch_size,
+        "reference": reference,
+        "modes": results
+    }
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compare the scores, time and tokens of the scoring modes on a fixed set of resumes")
+    parser.add_argument("resumes", nargs="*", help="Resume files, directories or glob patterns (synthetic resumes are generated if none are given)")
+    parser.add_argument("--criteria", help="JSON file with the criteria, as returned by /extract-criteria (the benchmark criteria by default)")
+    parser.add_argument("--modes", default="reflective,lean", help="Comma separated scoring modes (or cascade), the first one is the reference")
+    parser.add_argument("--count", type=int, default=50, help="Number of synthetic resumes, generated with a fixed seed")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--top-k", type=int, default=10, help="Number of top candidates compared between the modes")
+    parser.add_argument("--fake", action="store_true", help="Score against the local fake LLM server instead of the OpenAI API")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the fake LLM server")
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "results"), help="Directory of the JSON reports")
+    args = parser.parse_args()
+
+    # every mode has to call the model, so cached responses and stored scores are never used
+    os.environ.update(LLM_CACHE_ENABLED="false", LLM_CACHE_DB="", EXTRACTION_CACHE_DB="", INCREMENTAL_SCORING="false")
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix="resume-ranker-eval-")
+    try:
+        if args.fake:
+            os.environ.update(OPENAI_BASE_URL=f"http://127.0.0.1:{args.port}/v1", OPENAI_API_KEY="benchmark")
+            server = start_fake_server(argparse.Namespace(port=args.port, latency=0.2, jitter=0.1, error_rate=0.0, invalid_json_rate=0.0))
+
+        if args.resumes:
+            from bulk import collect_resume_paths
+            resume_paths = collect_resume_paths(args.resumes)
+        else:
+            resume_paths = generate_resumes(os.path.join(workdir, "resumes"), args.count)
+
+        criteria = default_criteria
+        if args.criteria:
+            with open(args.criteria, encoding="utf-8") as criteria_file:
+                criteria = json.load(criteria_file)["criteria"]
+
+        report = asyncio.run(evaluate(args, resume_paths, criteria))
+        print_report(report)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        report_path = os.path.join(args.output_dir, f"eval-{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"\nReport saved to {report_path}")
+
+    finally:
+        from utils.helpers import shutdown_parser_pool
+        shutdown_parser_pool()
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
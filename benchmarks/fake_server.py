@@ -0,0 +1,192 @@
+import re
+import ast
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Local stand-in for the OpenAI chat completions API used by the benchmarks. It answers the prompts of llm.py
+# with made up but valid responses after a configurable latency, and fails a configurable share of the calls
+# with rate limit / server errors or with a response that isn't valid JSON, so the retry paths are exercised too.
+# Prompt caching is simulated like the provider does it: once a prompt has at least 1024 tokens, the longest prefix
+# seen in a previous call (in steps of 128 tokens) is reported as cached tokens.
+
+class FakeLLMConfig:
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0, invalid_json_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.random = random.Random(seed)
+
+# counters of the calls answered since the last reset, read by the benchmark runner through /stats
+class FakeLLMStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {"requests": 0, "completions": 0, "rate_limited": 0, "server_errors": 0, "invalid_json": 0,
+                           "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.counts[name] += count
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+# simulated prompt cache, holds the hashes of the prompt prefixes seen so far (4 characters make a token)
+class PrefixCache:
+
+    min_tokens = 1024
+    step_tokens = 128
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prefixes = set()
+
+    # returns the number of cached tokens of the prompt and remembers its prefixes
+    def lookup(self, prompt: str) -> int:
+        boundaries = range(self.min_tokens * 4, len(prompt) + 1, self.step_tokens * 4)
+        hashes = [(boundary, hashlib.sha256(prompt[:boundary].encode()).digest()) for boundary in boundaries]
+
+        with self.lock:
+            cached = max((boundary for boundary, digest in hashes if digest in self.prefixes), default=0)
+            self.prefixes.update(digest for _, digest in hashes)
+        return cached // 4
+
+# deterministic score of a resume on a criterion, so repeated runs return the same ranking
+def fake_score(content: str, header: str) -> int:
+    return int(hashlib.sha256(f"{header}\n{content}".encode()).hexdigest(), 16) % 6
+
+# the generated resumes start with the name of the candidate
+def fake_name(content: str) -> str:
+    for line in content.strip().split("\n"):
+        if line.strip():
+            return line.strip()[:60]
+    return "Unknown Candidate"
+
+def find_literal(pattern: str, text: str):
+    match = re.search(pattern, text, re.DOTALL)
+    return ast.literal_eval(match.group(1)) if match else None
+
+# function to build the answer to a prompt of llm.py
+def answer(prompt: str) -> str:
+
+    criteria_list = find_literal(r"Here's the list of criteria: (\[.*?\])\n", prompt)
+    if criteria_list is not None:
+        return json.dumps({"criteria_headers": {criterion: f"Criterion {index + 1}" for index, criterion in enumerate(criteria_list)}})
+
+    criteria_headers = find_literal(r"criteria along with the headers: (\{.*?\})\n", prompt)
+    if criteria_headers is not None:
+        resumes = dict(re.findall(r'<resume id="(Resume \d+)">\n(.*?)\n</resume>', prompt, re.DOTALL))
+        if resumes:
+            return json.dumps({"candidates": {
+                resume_id: {"Candidate Name": fake_name(content), **{header: fake_score(content, header) for header in criteria_headers.values()}}
+                for resume_id, content in resumes.items()
+            }})
+
+        content = re.search(r"<resume>\n(.*?)\n</resume>", prompt, re.DOTALL)
+        content = content.group(1) if content else prompt
+        return json.dumps({"Candidate Name": fake_name(content), **{header: fake_score(content, header) for header in criteria_headers.values()}})
+
+    # anything else is a job description to extract the ranking criteria from
+    return json.dumps({"criteria": [
+        "5+ years of experience in Python development",
+        "Experience with cloud platforms such as AWS",
+        "Strong background in Machine Learning",
+        "Bachelor's degree in Computer Science or a related field"
+    ]})
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+
+    app = FastAPI(title="Fake LLM")
+    stats = FakeLLMStats()
+    prefix_cache = PrefixCache()
+
+    @app.get("/stats")
+    def get_stats():
+        return stats.snapshot()
+
+    @app.post("/stats/reset")
+    def reset_stats():
+        stats.reset()
+        return stats.snapshot()
+
+    # listed by the app when it starts, to open its connection ahead of the first call
+    @app.get("/v1/models")
+    def list_models():
+        return {"object": "list", "data": [{"id": model, "object": "model", "created": 0, "owned_by": "fake"} for model in ("gpt-4o", "gpt-4o-mini")]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(message["content"] for message in body["messages"] if isinstance(message.get("content"), str))
+        stats.add(requests=1)
+
+        await asyncio.sleep(max(config.latency + config.random.uniform(-config.jitter, config.jitter), 0))
+
+        outcome = config.random.random()
+        if outcome < config.error_rate / 2:
+            stats.add(rate_limited=1)
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                                status_code=429, headers={"retry-after-ms": "200"})
+        if outcome < config.error_rate:
+            stats.add(server_errors=1)
+            return JSONResponse({"error": {"message": "The server had an error", "type": "server_error", "code": None}}, status_code=500)
+
+        content = answer(prompt)
+        if config.random.random() < config.invalid_json_rate:
+            stats.add(invalid_json=1)
+            content = content[:len(content) // 2]
+
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = prefix_cache.lookup(prompt)
+        completion_tokens = estimate_tokens(content)
+        stats.add(completions=1, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens)
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        }
+
+    return app
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Local OpenAI compatible stub server for the benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before every response")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random seconds added to or removed from the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with a 429 or 500 error")
+    parser.add_argument("--invalid-json-rate", type=float, default=0.0, help="Share of calls answered with a cut JSON response")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(args.latency, args.jitter, args.error_rate, args.invalid_json_rate, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import fitz
+import random
+import argparse
+from typing import List
+from docx import Document
+
+# Generator of synthetic resumes and job descriptions for the benchmarks. Resumes have the usual sections
+# (summary, experience, skills, education) and their size is varied through the number of jobs listed.
+
+first_names = ["Alex", "Priya", "John", "Mei", "Carlos", "Fatima", "Liam", "Aiko", "Noah", "Sara", "Omar", "Elena"]
+last_names = ["Smith", "Sharma", "Chen", "Garcia", "Khan", "Müller", "Tanaka", "Okafor", "Rossi", "Novak", "Silva"]
+titles = ["Software Engineer", "Data Scientist", "Backend Developer", "ML Engineer", "DevOps Engineer", "Data Analyst"]
+companies = ["Tech Corp", "Cloudify", "DataWorks", "Finlytics", "MedAI", "RetailHub", "Streamline", "Quantix"]
+skills = ["Python", "Java", "Go", "SQL", "AWS", "GCP", "Azure", "Docker", "Kubernetes", "Terraform", "PyTorch",
+          "TensorFlow", "scikit-learn", "Spark", "Kafka", "PostgreSQL", "Redis", "FastAPI", "React", "CI/CD"]
+verbs = ["Built", "Designed", "Led", "Migrated", "Optimized", "Automated", "Maintained", "Shipped", "Scaled"]
+objects = ["a data pipeline", "the billing service", "ML models for classification", "the CI/CD workflow",
+           "a recommendation engine", "internal dashboards", "the search API", "a feature store", "monitoring and alerting"]
+outcomes = ["reducing latency by 40%", "serving 2M requests a day", "cutting cloud costs by 25%", "for 30 engineers",
+            "improving accuracy by 12%", "with zero downtime", "across 5 regions", "ahead of schedule"]
+
+lines_per_page = 45
+
+def generate_resume_lines(rng: random.Random, jobs: int) -> List[str]:
+
+    name = f"{rng.choice(first_names)} {rng.choice(last_names)}"
+    lines = [
+        name,
+        f"{rng.choice(titles)} | {name.lower().replace(' ', '.')}@example.com | +1 555 {rng.randint(1000, 9999)}",
+        "",
+        "Summary",
+        f"{rng.choice(titles)} with {rng.randint(1, 15)} years of experience in {', '.join(rng.sample(skills, 3))}.",
+        "",
+        "Experience"
+    ]
+
+    for _ in range(jobs):
+        start = rng.randint(2005, 2022)
+        lines.append(f"{rng.choice(titles)} - {rng.choice(companies)} ({start} - {start + rng.randint(1, 4)})")
+        for _ in range(rng.randint(3, 6)):
+            lines.append(f"- {rng.choice(verbs)} {rng.choice(objects)} using {rng.choice(skills)}, {rng.choice(outcomes)}")
+        lines.append("")
+
+    lines += [
+        "Skills",
+        ", ".join(rng.sample(skills, rng.randint(5, 12))),
+        "",
+        "Education",
+        f"B.Sc. in Computer Science - University of {rng.choice(['Toronto', 'Delhi', 'Munich', 'Lagos', 'Osaka'])} ({rng.randint(2000, 2020)})"
+    ]
+    return lines
+
+def write_pdf(path: str, lines: List[str]):
+    document = fitz.open()
+    for start in range(0, len(lines), lines_per_page):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 560, 800), "\n".join(lines[start:start + lines_per_page]), fontsize=10)
+    document.save(path)
+    document.close()
+
+def write_docx(path: str, lines: List[str]):
+    document = Document()
+    for line in lines:
+        document.add_paragraph(line)
+    document.save(path)
+
+writers = {".pdf": write_pdf, ".docx": write_docx}
+
+# function to write count resumes to the directory, alternating between the given formats
+# the number of jobs of every resume is picked between min_jobs and max_jobs, more jobs means more pages
+def generate_resumes(directory: str, count: int, formats: List[str] = [".pdf", ".docx"], min_jobs: int = 1, max_jobs: int = 12,
+                     seed: int = 0) -> List[str]:
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+
+    paths = []
+    for index in range(count):
+        file_ext = formats[index % len(formats)]
+        path = os.path.join(directory, f"resume_{index:05d}{file_ext}")
+        writers[file_ext](path, generate_resume_lines(rng, rng.randint(min_jobs, max_jobs)))
+        paths.append(path)
+
+    return paths
+
+def generate_job_description(path: str, seed: int = 0) -> str:
+
+    rng = random.Random(seed)
+    lines = [
+        f"Senior {rng.choice(titles)}",
+        "",
+        "About the role",
+        f"We are looking for an engineer to join the {rng.choice(companies)} platform team.",
+        "",
+        "Requirements",
+        *[f"- {years}+ years of experience with {skill}" for years, skill in zip([5, 3, 2], rng.sample(skills, 3))],
+        "- Experience with cloud platforms such as AWS",
+        "- Bachelor's degree in Computer Science or a related field",
+        "",
+        "Nice to have",
+        f"- Familiarity with {', '.join(rng.sample(skills, 3))}"
+    ]
+    writers[os.path.splitext(path)[1].lower()](path, lines)
+    return path
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generate synthetic resumes for the benchmarks")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--formats", default=".pdf,.docx", help="Comma separated file extensions")
+    parser.add_argument("--min-jobs", type=int, default=1)
+    parser.add_argument("--max-jobs", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_resumes(args.directory, args.count, args.formats.split(","), args.min_jobs, args.max_jobs, args.seed)
+    print(f"Wrote {len(paths)} resumes to {args.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import httpx
+import numpy as np
+from typing import List, Optional, Tuple
+from benchmarks.generate import generate_resumes, generate_job_description
+
+# Benchmark runner. It starts the fake LLM server, generates synthetic resumes and runs every scenario in a
+# fresh process against the app (so peak RSS is measured per scenario), then reports latency percentiles,
+# throughput, peak RSS and the retries caused by the injected failures. Reports are saved as JSON so runs on
+# different commits can be compared with --compare.
+
+scenario_names = ["extraction", "extract-criteria", "score-resumes", "end-to-end"]
+
+criteria = [
+    "5+ years of experience in Python development",
+    "Experience with cloud platforms such as AWS",
+    "Strong background in Machine Learning",
+    "Bachelor's degree in Computer Science or a related field"
+]
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+def peak_rss_mb(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# the scenarios below run inside the worker process, the app is imported there once the environment is set up
+# every scenario returns the latency of each sample and the time spent on the samples (app startup excluded)
+
+def run_extraction(resume_paths: List[str]) -> Tuple[List[float], float]:
+    from utils.helpers import extract_content_from_path
+
+    async def timed(path):
+        start = time.perf_counter()
+        await extract_content_from_path(os.path.splitext(path)[1].lower(), path)
+        return time.perf_counter() - start
+
+    async def run():
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[timed(path) for path in resume_paths])
+        return latencies, time.perf_counter() - start
+
+    return asyncio.run(run())
+
+def post_files(client, url: str, paths: List[str], field: str, data: dict):
+    handles = [open(path, "rb") for path in paths]
+    try:
+        start = time.perf_counter()
+        response = client.post(url, files=[(field, (os.path.basename(path), handle)) for path, handle in zip(paths, handles)], data=data)
+        return time.perf_counter() - start, response
+    finally:
+        for handle in handles:
+            handle.close()
+
+def run_extract_criteria(job_description_path: str, repeats: int) -> Tuple[List[float], float]:
+    from fastapi.testclient import TestClient
+    from main import app
+
+    latencies = []
+    with TestClient(app) as client:
+        for _ in range(repeats):
+            latency, response = post_files(client, "/extract-criteria", [job_description_path], "file", {})
+            latencies.append(latency)
+            if "criteria" not in response.json():
+                print(f"Criteria extraction failed : {response.text}", file=sys.stderr)
+    return latencies, sum(latencies)
+
+def run_score_resumes(resume_paths: List[str], repeats: int, batch_size: int) -> Tuple[List[float], float]:
+    from fastapi.testclient import TestClient
+    from main import app
+
+    latencies = []
+    with TestClient(app) as client:
+        for _ in range(repeats):
+            latency, response = post_files(client, "/score-resumes", resume_paths, "files", {
+                "criteria": json.dumps({"criteria": criteria}),
+                "batch_size": str(batch_size),
+                "output_format": "json"
+            })
+            latencies.append(latency)
+            scored = len(response.json().get("results") or [])
+            if scored < len(resume_paths):
+                print(f"Only {scored} out of {len(resume_paths)} resumes were scored", file=sys.stderr)
+    return latencies, sum(latencies)
+
+# runs a single scenario and writes its latencies and peak RSS to the result file
+def run_worker(args):
+
+    with open(os.path.join(args.workdir, "resumes.json"), encoding="utf-8") as paths_file:
+        resume_paths = json.load(paths_file)[:args.count]
+
+    if args.worker == "extraction":
+        latencies, elapsed = run_extraction(resume_paths)
+    elif args.worker == "extract-criteria":
+        latencies, elapsed = run_extract_criteria(os.path.join(args.workdir, "job_description.pdf"), args.repeats)
+    elif args.worker == "score-resumes":
+        latencies, elapsed = run_score_resumes(resume_paths, args.repeats, args.batch_size)
+    else:
+        latencies, elapsed = run_score_resumes(resume_paths, 1, args.batch_size)
+
+    from utils.helpers import shutdown_parser_pool
+    shutdown_parser_pool()
+
+    with open(args.result, "w", encoding="utf-8") as result_file:
+        json.dump({
+            "latencies": latencies,
+            "elapsed": elapsed,
+            "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+            # biggest of the parser worker processes, they are waited for when the pool shuts down
+            "peak_child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)
+        }, result_file)
+
+def start_fake_server(args) -> subprocess.Popen:
+
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_server", "--port", str(args.port), "--latency", str(args.latency),
+        "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--invalid-json-rate", str(args.invalid_json_rate)
+    ])
+
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{args.port}/stats")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+    server.terminate()
+    raise RuntimeError("The fake LLM server didn't start")
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_scenario(args, name: str, count: int, repeats: int, env: dict) -> dict:
+
+    server_url = f"http://127.0.0.1:{args.port}"
+    httpx.post(f"{server_url}/stats/reset")
+
+    result_path = os.path.join(args.workdir, f"{name}-{count}.json")
+    subprocess.run([
+        sys.executable, "-m", "benchmarks.run", "--worker", name, "--workdir", args.workdir, "--result", result_path,
+        "--count", str(count), "--repeats", str(repeats), "--batch-size", str(args.batch_size)
+    ], env=env, check=True, stdout=None if args.verbose else subprocess.DEVNULL)
+
+    with open(result_path, encoding="utf-8") as result_file:
+        result = json.load(result_file)
+    stats = httpx.get(f"{server_url}/stats").json()
+
+    latencies = np.array(result["latencies"])
+    resumes = 0 if name == "extract-criteria" else count * (repeats if name == "score-resumes" else 1)
+
+    return {
+        "scenario": name,
+        "resumes": count if name != "extract-criteria" else 0,
+        "samples": len(latencies),
+        "p50_seconds": float(np.percentile(latencies, 50)),
+        "p95_seconds": float(np.percentile(latencies, 95)),
+        "mean_seconds": float(latencies.mean()),
+        "elapsed_seconds": result["elapsed"],
+        "resumes_per_second": resumes / result["elapsed"] if resumes else None,
+        "peak_rss_mb": result["peak_rss_mb"],
+        "peak_child_rss_mb": result["peak_child_rss_mb"],
+        "llm_calls": stats["requests"],
+        # every injected failure is retried, either by the scheduler (errors) or by the response validation (invalid JSON)
+        "retries": stats["rate_limited"] + stats["server_errors"] + stats["invalid_json"],
+        "rate_limited": stats["rate_limited"],
+        "server_errors": stats["server_errors"],
+        "invalid_json": stats["invalid_json"],
+        "prompt_tokens": stats["prompt_tokens"],
+        "cached_tokens": stats["cached_tokens"],
+        "cache_hit_rate": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else None,
+        "completion_tokens": stats["completion_tokens"]
+    }
+
+def scenario_label(result: dict) -> str:
+    return f"{result['scenario']}[{result['resumes']}]" if result["resumes"] else result["scenario"]
+
+def format_number(value: Optional[float], digits: int = 3) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+
+    baseline_results = {scenario_label(result): result for result in baseline["scenarios"]} if baseline else {}
+
+    print(f"\nCommit {report['commit']}, fake LLM latency {report['config']['latency']}s, error rate {report['config']['error_rate']}, "
+          f"invalid JSON rate {report['config']['invalid_json_rate']}")
+    print(f"{'scenario':<22}{'p50 s':>9}{'p95 s':>9}{'resumes/s':>11}{'rss MB':>9}{'child MB':>10}{'calls':>7}{'retries':>9}{'cached %':>10}")
+
+    for result in report["scenarios"]:
+        label = scenario_label(result)
+        print(f"{label:<22}{format_number(result['p50_seconds']):>9}{format_number(result['p95_seconds']):>9}"
+              f"{format_number(result['resumes_per_second'], 2):>11}{result['peak_rss_mb']:>9.1f}{result['peak_child_rss_mb']:>10.1f}"
+              f"{result['llm_calls']:>7}{result['retries']:>9}"
+              f"{format_number(100 * result['cache_hit_rate'] if result['cache_hit_rate'] is not None else None, 1):>10}")
+
+        previous = baseline_results.get(label)
+        if previous:
+            changes = [f"{name} {100 * (result[key] - previous[key]) / previous[key]:+.1f}%"
+                       for name, key in [("p50", "p50_seconds"), ("p95", "p95_seconds"), ("resumes/s", "resumes_per_second"), ("rss", "peak_rss_mb")]
+                       if result[key] and previous[key]]
+            print(f"{'':<22}vs {baseline['commit']}: {', '.join(changes)}")
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the resume ranking pipeline against a local fake LLM server")
+    parser.add_argument("--scenarios", default=",".join(scenario_names), help="Comma separated scenarios to run")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma separated numbers of resumes for the end-to-end scenario")
+    parser.add_argument("--repeats", type=int, default=20, help="Requests sent by the extract-criteria and score-resumes scenarios")
+    parser.add_argument("--resumes", type=int, default=5, help="Resumes per request of the score-resumes scenario")
+    parser.add_argument("--batch-size", type=int, default=1, help="batch_size sent to /score-resumes")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the fake LLM server")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before every fake LLM response")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake LLM calls failing with a 429 or 500")
+    parser.add_argument("--invalid-json-rate", type=float, default=0.0, help="Share of fake LLM calls returning invalid JSON")
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "results"), help="Directory of the JSON reports")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the app")
+    # used internally to run a single scenario in its own process
+    parser.add_argument("--worker", choices=scenario_names, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    scenarios = args.scenarios.split(",")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    args.workdir = tempfile.mkdtemp(prefix="resume-ranker-bench-")
+
+    # the app talks to the fake server, and every cache is turned off so each run does the full work
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.port}/v1",
+        OPENAI_API_KEY="benchmark",
+        LLM_CACHE_ENABLED="false",
+        LLM_CACHE_DB="",
+        EXTRACTION_CACHE_MEMORY_BYTES="0",
+        EXTRACTION_CACHE_DB="",
+        INCREMENTAL_SCORING="false",
+        JOBS_DB=os.path.join(args.workdir, "jobs.sqlite3"),
+        OUTPUT_DIR=os.path.join(args.workdir, "outputs"),
+        MAX_UPLOAD_REQUEST_BYTES=str(4 * 1024 * 1024 * 1024)
+    )
+
+    server = None
+    try:
+        print(f"Generating {max(sizes + [args.resumes])} resumes in {args.workdir}")
+        resume_paths = generate_resumes(os.path.join(args.workdir, "resumes"), max(sizes + [args.resumes]))
+        with open(os.path.join(args.workdir, "resumes.json"), "w", encoding="utf-8") as paths_file:
+            json.dump(resume_paths, paths_file)
+        generate_job_description(os.path.join(args.workdir, "job_description.pdf"))
+
+        server = start_fake_server(args)
+
+        results = []
+        for name in scenarios:
+            runs = [(size, 1) for size in sizes] if name == "end-to-end" else [(max(sizes) if name == "extraction" else args.resumes, args.repeats)]
+            for count, repeats in runs:
+                print(f"Running {name}" + ("" if name == "extract-criteria" else f" with {count} resumes"))
+                results.append(run_scenario(args, name, count, repeats, env))
+
+        report = {
+            "commit": get_git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                       "invalid_json_rate": args.invalid_json_rate, "batch_size": args.batch_size},
+            "scenarios": results
+        }
+
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+        print_report(report, baseline)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        report_path = os.path.join(args.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"\nReport saved to {report_path}")
+
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
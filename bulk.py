@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import argparse
+from abc import ABC, abstractmethod
+from glob import glob
+from typing import Dict, List
+from llm import get_client, get_request_params, get_scoring_prompt, scoring_modes, default_scoring_mode
+from utils.helpers import extract_content_from_path, compact_resume_text, get_criteria_headers, get_all_candidate_scores, validate_candidate_scores, build_score_table, shutdown_parser_pool, \
+    get_scoring_options
+from models import CandidateScores
+
+# Offline bulk scoring built on the OpenAI Batch API JSONL format:
+#   1. prepare: writes one request line per resume scoring prompt along with a manifest of the job
+#   2. submit: hands the request file to a batch backend (OpenAI or a local stand-in) and returns a batch id
+#   3. ingest: reads the result lines back, validates them and writes the ranking table
+
+allowed_extensions = [".pdf", ".docx"]
+
+batch_endpoint = "/v1/chat/completions"
+
+# function to collect resume files from directories, glob patterns or file paths
+def collect_resume_paths(sources: List[str]) -> List[str]:
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = [os.path.join(source, name) for name in os.listdir(source)]
+        else:
+            matches = glob(source, recursive=True)
+        paths.extend(path for path in matches if os.path.splitext(path)[1].lower() in allowed_extensions)
+
+    # keeping the order stable and dropping paths listed more than once
+    return sorted(set(paths))
+
+def get_manifest_path(requests_path: str) -> str:
+    return f"{requests_path}.manifest.json"
+
+# function to write the batch request file, contents maps a custom id to the resume content
+def write_batch_requests(requests_path: str, contents: Dict[str, str], criteria_headers: dict, scoring_mode: str = default_scoring_mode):
+
+    options = get_scoring_options(criteria_headers, scoring_mode)
+    with open(requests_path, "w", encoding="utf-8") as requests_file:
+        for custom_id, content in contents.items():
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": batch_endpoint,
+                "body": get_request_params(get_scoring_prompt(content, criteria_headers), **options)
+            }
+            requests_file.write(json.dumps(line) + "\n")
+
+# function to read the result file of a batch, every custom id maps to the validated scores of that resume
+def read_batch_results(results_path: str, criteria_headers: dict) -> Dict[str, CandidateScores]:
+
+    results = {}
+
+    with open(results_path, encoding="utf-8") as results_file:
+        for line in results_file:
+            if not line.strip():
+                continue
+
+            result = json.loads(line)
+            custom_id = result["custom_id"]
+
+            try:
+                response = result.get("response") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    raise ValueError(f"request failed with {result.get('error') or response.get('status_code')}")
+
+                candidate_scores = json.loads(response["body"]["choices"][0]["message"]["content"])
+
+                # same checks as the online scoring, invalid results are marked as errors
+                if validate_candidate_scores(candidate_scores, criteria_headers) is not None:
+                    raise ValueError("scores don't match the criteria headers")
+
+                results[custom_id] = CandidateScores(
+                    Candidate_Name=candidate_scores.pop("Candidate Name"),
+                    scores=candidate_scores
+                )
+
+            except Exception as e:
+                print(f"Invalid result for {custom_id} : {str(e)}")
+                results[custom_id] = CandidateScores(Candidate_Name="Error", scores={})
+
+    return results
+
+# Base class for the backends that run a batch request file, a backend missing a method can't be created
+class BatchBackend(ABC):
+
+    # submits the request file and returns the batch id
+    @abstractmethod
+    def submit(self, requests_path: str) -> str:
+        pass
+
+    # returns the batch status, "completed" once results can be downloaded
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        pass
+
+    # writes the result file of a completed batch to results_path
+    @abstractmethod
+    def download(self, batch_id: str, results_path: str):
+        pass
+
+# Backend using the OpenAI Batch API
+class OpenAIBatchBackend(BatchBackend):
+
+    def __init__(self, completion_window: str = "24h"):
+        self.completion_window = completion_window
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, "rb") as requests_file:
+            input_file = get_client().files.create(file=requests_file, purpose="batch")
+
+        batch = get_client().batches.create(
+            input_file_id=input_file.id,
+            endpoint=batch_endpoint,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return get_client().batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, results_path: str):
+        batch = get_client().batches.retrieve(batch_id)
+
+        # requests that failed on the provider side are in a separate error file, both use the same line format
+        with open(results_path, "wb") as results_file:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    results_file.write(get_client().files.content(file_id).content)
+
+# Local stand-in for the Batch API, runs every request through the chat completions API of the configured
+# client (which can point to a local server through OPENAI_BASE_URL) and keeps the files in a directory
+class LocalBatchBackend(BatchBackend):
+
+    def __init__(self, batch_dir: str = "local_batches"):
+        self.batch_dir = batch_dir
+
+    def get_path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.batch_dir, batch_id, name)
+
+    def submit(self, requests_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.batch_dir, batch_id))
+        shutil.copyfile(requests_path, self.get_path(batch_id, "input.jsonl"))
+
+        # requests are processed right away, so the batch is completed once submit returns
+        with open(self.get_path(batch_id, "input.jsonl"), encoding="utf-8") as requests_file, \
+                open(self.get_path(batch_id, "output.jsonl"), "w", encoding="utf-8") as results_file:
+            for line in requests_file:
+                if line.strip():
+                    results_file.write(json.dumps(self.run_request(json.loads(line))) + "\n")
+
+        return batch_id
+
+    # runs a single request line and returns the result line in the Batch API output format
+    def run_request(self, request: dict) -> dict:
+        result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "response": None, "error": None}
+
+        try:
+            completion = get_client().chat.completions.create(**request["body"])
+            result["response"] = {"status_code": 200, "body": completion.model_dump()}
+        except Exception as e:
+            result["error"] = {"code": type(e).__name__, "message": str(e)}
+
+        return result
+
+    def status(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self.get_path(batch_id, "output.jsonl")) else "not_found"
+
+    def download(self, batch_id: str, results_path: str):
+        shutil.copyfile(self.get_path(batch_id, "output.jsonl"), results_path)
+
+backends = {"openai": OpenAIBatchBackend, "local": LocalBatchBackend}
+
+# function to extract and compact the text of a resume file, returns None if it couldn't be extracted
+async def read_resume(path: str):
+
+    text_content = await extract_content_from_path(os.path.splitext(path)[1].lower(), path)
+
+    return compact_resume_text(text_content)[0] if text_content is not None else None
+
+# function to extract the resumes and write the batch request file along with its manifest
+async def prepare(criteria: List[str], resume_paths: List[str], requests_path: str, scoring_mode: str = default_scoring_mode):
+
+    criteria_headers = await get_criteria_headers(criteria)
+    if "Error" in criteria_headers.criteria_headers:
+        raise RuntimeError("Failed to generate criteria headers")
+
+    extracted = await asyncio.gather(*[read_resume(path) for path in resume_paths])
+
+    contents = {}
+    files = {}
+    for index, (path, text_content) in enumerate(zip(resume_paths, extracted)):
+        if text_content is None:
+            print(f"Skipping {path} as its content couldn't be extracted")
+            continue
+        custom_id = f"resume-{index}"
+        contents[custom_id] = text_content
+        files[custom_id] = path
+
+    write_batch_requests(requests_path, contents, criteria_headers.criteria_headers, scoring_mode)
+
+    with open(get_manifest_path(requests_path), "w", encoding="utf-8") as manifest_file:
+        json.dump({"criteria_headers": criteria_headers.criteria_headers, "scoring_mode": scoring_mode, "files": files}, manifest_file, indent=2)
+
+    print(f"Wrote {len(contents)} requests to {requests_path}")
+
+# function to read the results of a batch and write the ranking table, failed resumes can be re-scored online
+async def ingest(results_path: str, requests_path: str, output_path: str, retry_failed: bool = False):
+
+    with open(get_manifest_path(requests_path), encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    criteria_headers = manifest["criteria_headers"]
+    results = read_batch_results(results_path, criteria_headers)
+
+    # resumes without a valid result, including the ones missing from the result file
+    failed = [custom_id for custom_id in manifest["files"] if results.get(custom_id, CandidateScores(Candidate_Name="Error", scores={})).Candidate_Name == "Error"]
+    print(f"{len(manifest['files']) - len(failed)} resumes scored, {len(failed)} failed")
+
+    if retry_failed and failed:
+        contents = await asyncio.gather(*[read_resume(manifest["files"][custom_id]) for custom_id in failed])
+        rescored = await get_all_candidate_scores(contents, criteria_headers, scoring_mode=manifest.get("scoring_mode", default_scoring_mode))
+        results.update(zip(failed, rescored))
+
+    score_df = build_score_table(list(results.values()), criteria_headers)
+    score_df.to_csv(output_path, index=False)
+    print(f"Ranking table saved to {output_path}")
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Offline bulk resume scoring using the OpenAI Batch API file format")
+    parser.add_argument("--backend", choices=list(backends), default="openai", help="Backend that runs the batch")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = subparsers.add_parser("prepare", help="Write the batch request file for a set of resumes")
+    prepare_parser.add_argument("--criteria", required=True, help="JSON file with the criteria, as returned by /extract-criteria")
+    prepare_parser.add_argument("--requests", default="batch_requests.jsonl", help="Batch request file to write")
+    prepare_parser.add_argument("--scoring-mode", choices=scoring_modes, default=default_scoring_mode,
+                                help="reflective, or lean for a minimal system prompt with structured output")
+    prepare_parser.add_argument("resumes", nargs="+", help="Resume files, directories or glob patterns")
+
+    submit_parser = subparsers.add_parser("submit", help="Submit a batch request file")
+    submit_parser.add_argument("--requests", default="batch_requests.jsonl", help="Batch request file to submit")
+
+    status_parser = subparsers.add_parser("status", help="Show the status of a batch")
+    status_parser.add_argument("batch_id")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Download the results of a batch and write the ranking table")
+    ingest_parser.add_argument("batch_id")
+    ingest_parser.add_argument("--requests", default="batch_requests.jsonl", help="Batch request file that was submitted")
+    ingest_parser.add_argument("--results", default="batch_results.jsonl", help="Where to save the downloaded results")
+    ingest_parser.add_argument("--output", default="Resume scorer card.csv", help="Ranking table to write")
+    ingest_parser.add_argument("--retry-failed", action="store_true", help="Re-score the resumes without a valid result online")
+    ingest_parser.add_argument("--wait", action="store_true", help="Wait for the batch to complete before ingesting")
+
+    args = parser.parse_args()
+    backend = backends[args.backend]()
+
+    try:
+        if args.command == "prepare":
+            with open(args.criteria, encoding="utf-8") as criteria_file:
+                criteria = json.load(criteria_file)["criteria"]
+            asyncio.run(prepare(criteria, collect_resume_paths(args.resumes), args.requests, args.scoring_mode))
+
+        elif args.command == "submit":
+            print(backend.submit(args.requests))
+
+        elif args.command == "status":
+            print(backend.status(args.batch_id))
+
+        elif args.command == "ingest":
+            status = backend.status(args.batch_id)
+            while args.wait and status not in ("completed", "failed", "expired", "cancelled", "not_found"):
+                time.sleep(60)
+                status = backend.status(args.batch_id)
+
+            if status != "completed":
+                raise SystemExit(f"Batch {args.batch_id} is {status}")
+
+            backend.download(args.batch_id, args.results)
+            asyncio.run(ingest(args.results, args.requests, args.output, args.retry_failed))
+
+    finally:
+        shutdown_parser_pool()
+
+if __name__ == "__main__":
+    main()
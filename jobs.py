@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+from models import CandidateScores
+from utils.helpers import extract_content, compact_resume_text, get_criteria_headers, iter_candidate_scores, build_score_table
+from llm import max_concurrency, default_scoring_mode
+
+# Persistent job queue for large scoring runs. Jobs and their resumes are kept in SQLite and every scored
+# resume is checkpointed, so a restarted worker picks unfinished jobs back up and only scores what is left.
+# Workers hold a lease on the job they are running, a job whose lease ran out (e.g. the worker died) is
+# claimed again by the next worker that polls the queue.
+
+jobs_db = os.getenv("JOBS_DB", "jobs.sqlite3")
+lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+poll_seconds = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# uploaded files are copied into the job store in chunks of this size, so a large upload is never held in memory at once
+upload_chunk_bytes = int(os.getenv("JOB_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# job statuses, completed/failed/cancelled jobs are never picked up again
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# resume statuses
+PENDING = "pending"
+SCORED = "scored"
+ERROR = "error"
+
+class JobStore:
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            criteria TEXT NOT NULL,
+            criteria_headers TEXT,
+            batch_size INTEGER NOT NULL,
+            scoring_mode TEXT,
+            error TEXT,
+            lease_owner TEXT,
+            lease_expires REAL,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        )""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS resumes (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            file_ext TEXT NOT NULL,
+            content BLOB,
+            status TEXT NOT NULL,
+            result TEXT,
+            PRIMARY KEY (job_id, idx)
+        )""")
+        # content of the uploaded resumes, resumes of older job stores have it in resumes.content instead
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS resume_chunks (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (job_id, idx, seq)
+        )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+        # job stores created before the scoring mode was added get the column, their jobs run in the default mode
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(jobs)").fetchall()]
+        if "scoring_mode" not in columns:
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN scoring_mode TEXT")
+
+    @contextmanager
+    def transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    # uploads are (filename, file_ext, path) of the spooled files, each file is copied in chunks within its own
+    # transaction so the store is never locked for the whole upload. The job itself is inserted last, so workers
+    # don't pick it up before all of its resumes are in. Blocks on the disk, call it from a thread in the API
+    def create_job(self, criteria: List[str], batch_size: int, scoring_mode: str, uploads: List[Tuple[str, str, str]]) -> str:
+        job_id = uuid.uuid4().hex
+
+        try:
+            for index, (filename, file_ext, path) in enumerate(uploads):
+                with open(path, "rb") as upload, self.lock, self.transaction():
+                    self.connection.execute(
+                        "INSERT INTO resumes (job_id, idx, filename, file_ext, status) VALUES (?, ?, ?, ?, ?)",
+                        (job_id, index, filename, file_ext, PENDING)
+                    )
+                    for seq, data in enumerate(iter(lambda: upload.read(upload_chunk_bytes), b"")):
+                        self.connection.execute(
+                            "INSERT INTO resume_chunks (job_id, idx, seq, data) VALUES (?, ?, ?, ?)", (job_id, index, seq, data)
+                        )
+
+            now = time.time()
+            with self.lock:
+                self.connection.execute(
+                    "INSERT INTO jobs (id, status, criteria, batch_size, scoring_mode, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, json.dumps(criteria), batch_size, scoring_mode, now, now)
+                )
+
+        except BaseException:
+            # the resumes copied so far belong to no job
+            with self.lock, self.transaction():
+                self.connection.execute("DELETE FROM resume_chunks WHERE job_id = ?", (job_id,))
+                self.connection.execute("DELETE FROM resumes WHERE job_id = ?", (job_id,))
+            raise
+
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([column[0] for column in cursor.description], row))
+
+            counts = dict(self.connection.execute(
+                "SELECT status, COUNT(*) FROM resumes WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+
+        job["criteria"] = json.loads(job["criteria"])
+        job["criteria_headers"] = json.loads(job["criteria_headers"]) if job["criteria_headers"] else None
+        job["total"] = sum(counts.values())
+        job["scored"] = counts.get(SCORED, 0)
+        job["failed"] = counts.get(ERROR, 0)
+        return job
+
+    # atomically claims the oldest queued job, or a running job whose lease has expired
+    def claim_job(self, owner: str) -> Optional[str]:
+        now = time.time()
+
+        with self.lock, self.transaction():
+            row = self.connection.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                    (RUNNING, owner, now + lease_seconds, now, row[0])
+                )
+
+        return row[0] if row is not None else None
+
+    # extends the lease of a job, returns False if the job is no longer running under this owner
+    def renew_lease(self, job_id: str, owner: str) -> bool:
+        with self.lock:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, job_id, RUNNING, owner)
+            )
+        return cursor.rowcount == 1
+
+    def set_criteria_headers(self, job_id: str, criteria_headers: dict):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET criteria_headers = ?, updated = ? WHERE id = ?",
+                (json.dumps(criteria_headers), time.time(), job_id)
+            )
+
+    # moves a job to a final status, only if it is still running (or queued when cancelling)
+    def finish_job(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        from_statuses = (QUEUED, RUNNING) if status == CANCELLED else (RUNNING,)
+        placeholders = ", ".join("?" for _ in from_statuses)
+
+        with self.lock:
+            cursor = self.connection.execute(
+                f"UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? WHERE id = ? AND status IN ({placeholders})",
+                (status, error, time.time(), job_id, *from_statuses)
+            )
+        return cursor.rowcount == 1
+
+    # returns the next resumes of a job that are still to be scored
+    def get_pending_resumes(self, job_id: str, limit: int) -> List[Tuple[int, str, bytes]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT idx, file_ext, content FROM resumes WHERE job_id = ? AND status = ? ORDER BY idx LIMIT ?",
+                (job_id, PENDING, limit)
+            ).fetchall()
+            return [(index, file_ext, content if content is not None else self.get_content(job_id, index)) for index, file_ext, content in rows]
+
+    def get_content(self, job_id: str, index: int) -> bytes:
+        return b"".join(row[0] for row in self.connection.execute(
+            "SELECT data FROM resume_chunks WHERE job_id = ? AND idx = ? ORDER BY seq", (job_id, index)
+        ))
+
+    # checkpoints the result of a resume, the uploaded content isn't needed anymore once it is scored
+    def save_result(self, job_id: str, index: int, candidate_scores: Optional[CandidateScores]):
+        failed = candidate_scores is None or candidate_scores.Candidate_Name == "Error"
+
+        with self.lock, self.transaction():
+            self.connection.execute(
+                "UPDATE resumes SET status = ?, result = ?, content = NULL WHERE job_id = ? AND idx = ?",
+                (ERROR if failed else SCORED, None if failed else candidate_scores.model_dump_json(), job_id, index)
+            )
+            self.connection.execute("DELETE FROM resume_chunks WHERE job_id = ? AND idx = ?", (job_id, index))
+            self.connection.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def get_results(self, job_id: str) -> List[CandidateScores]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT result FROM resumes WHERE job_id = ? AND status = ? ORDER BY idx", (job_id, SCORED)
+            ).fetchall()
+        return [CandidateScores.model_validate_json(row[0]) for row in rows]
+
+# Worker that runs queued jobs in the background of the API process
+class JobWorker:
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                job_id = self.store.claim_job(self.owner)
+            except sqlite3.Error as e:
+                # e.g. another process held the database locked for too long, the next poll tries again
+                print(f"Error while claiming a job : {str(e)}")
+                job_id = None
+
+            if job_id is None:
+                await asyncio.sleep(poll_seconds)
+                continue
+
+            # the job runs in its own task, so the heartbeat can stop it once the lease is lost
+            processing = asyncio.create_task(self.process_job(job_id))
+            heartbeat = asyncio.create_task(self.heartbeat(job_id, processing))
+            try:
+                await processing
+            except asyncio.CancelledError:
+                # stopped by the heartbeat, the job was cancelled or another worker took it over
+                if heartbeat.done() and not heartbeat.cancelled():
+                    continue
+                # the worker is stopping, the lease is left to expire so another worker, or this one after a restart, resumes the job
+                raise
+            except Exception as e:
+                print(f"Error while processing job {job_id} : {str(e)}")
+                self.store.finish_job(job_id, FAILED, str(e))
+            finally:
+                heartbeat.cancel()
+
+    # keeps renewing the lease while the job is being processed, and stops the processing once the lease is lost
+    async def heartbeat(self, job_id: str, processing: asyncio.Task):
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                renewed = self.store.renew_lease(job_id, self.owner)
+            except sqlite3.Error as e:
+                # the lease is still held until it expires, the next beat tries again
+                print(f"Error while renewing the lease of job {job_id} : {str(e)}")
+                continue
+            if not renewed:
+                break
+
+        print(f"Job {job_id} is no longer running under this worker, stopping it")
+        processing.cancel()
+
+    async def process_job(self, job_id: str):
+        job = self.store.get_job(job_id)
+
+        # criteria headers are generated once per job and kept for the restarts
+        criteria_headers = job["criteria_headers"]
+        if criteria_headers is None:
+            headers_response = await get_criteria_headers(job["criteria"])
+            if "Error" in headers_response.criteria_headers:
+                self.store.finish_job(job_id, FAILED, "Failed to generate criteria headers")
+                return
+            criteria_headers = headers_response.criteria_headers
+            self.store.set_criteria_headers(job_id, criteria_headers)
+
+        # resumes are scored in chunks so a cancelled job stops after the chunk in progress
+        # every resume of a chunk is checkpointed, so the next chunk starts with the following ones
+        chunk_size = max_concurrency * max(job["batch_size"], 1)
+        while True:
+            # stopping once the job was cancelled, or taken over by another worker after the lease ran out
+            current = self.store.get_job(job_id)
+            if current["status"] != RUNNING or current["lease_owner"] != self.owner:
+                return
+
+            chunk = self.store.get_pending_resumes(job_id, chunk_size)
+            if not chunk:
+                break
+
+            extracted = await asyncio.gather(*[extract_content(file_ext, content) for _, file_ext, content in chunk])
+
+            # resumes whose content couldn't be extracted are checkpointed as failed
+            parsed = []
+            for (index, _, _), text_content in zip(chunk, extracted):
+                if text_content is None:
+                    self.store.save_result(job_id, index, None)
+                else:
+                    parsed.append((index, compact_resume_text(text_content)[0]))
+
+            scoring_mode = job["scoring_mode"] or default_scoring_mode
+            async for position, candidate_scores in iter_candidate_scores([text for _, text in parsed], criteria_headers, job["batch_size"], scoring_mode):
+                self.store.save_result(job_id, parsed[position][0], candidate_scores)
+
+        self.store.finish_job(job_id, COMPLETED)
+
+# function to get the ranking of the scored resumes of a job, partial while the job is still running
+def get_job_ranking(store: JobStore, job: dict) -> list:
+
+    if not job["criteria_headers"]:
+        return []
+
+    score_df = build_score_table(store.get_results(job["id"]), job["criteria_headers"])
+    return json.loads(score_df.to_json(orient="records"))
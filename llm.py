@@ -1,19 +1,100 @@
 import os
-from openai import OpenAI
+import json
+import time
+import asyncio
+import hashlib
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+from httpx import Limits
 from dotenv import load_dotenv
+from utils.cache import TieredCache
+from utils.scheduler import CallScheduler
+from utils.metrics import record_llm_call, record_cache_hit, trace_logs
 
 # loading API key from .env file
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# function that takes prompt as input and generate the result
-def generate_response(query):
-
-    max_retries = 5
-    attempt = 1
-
-    system_prompt = """
+# model used for every call unless another model is asked for (e.g. by the cascade scoring)
+default_model = os.getenv("LLM_MODEL", "gpt-4o")
+
+# maximum number of model calls allowed in flight at once from this process
+max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# clients are created on first use (or when the app starts, see warm_up_client), so importing this module stays cheap
+_client = None
+_async_client = None
+
+# the lifespan of the app opens a connection to the provider before the first request, a failure there is only logged
+llm_warmup = os.getenv("LLM_WARMUP", "true").lower() == "true"
+llm_warmup_timeout = float(os.getenv("LLM_WARMUP_TIMEOUT", "5"))
+
+# shared by every model call of the process, the limits should match the account's limits (unset means no limit)
+# the token buckets are kept in LLM_RATE_LIMIT_DB, so every process of the app (e.g. uvicorn workers) shares the limits,
+# setting it to an empty value keeps them per process
+scheduler = CallScheduler(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE")) if os.getenv("LLM_REQUESTS_PER_MINUTE") else None,
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE")) if os.getenv("LLM_TOKENS_PER_MINUTE") else None,
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+    failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+    reset_seconds=float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30")),
+    state_path=os.getenv("LLM_RATE_LIMIT_DB", "rate_limits.sqlite3")
+)
+
+# cache of validated responses, all calls use temperature 0 so the same request gets the same answer
+# setting LLM_CACHE_DB to an empty value keeps the cache in memory only
+cache_enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+response_cache = TieredCache(
+    memory_max_bytes=int(os.getenv("LLM_CACHE_MEMORY_BYTES", 32 * 1024 * 1024)),
+    disk_path=os.getenv("LLM_CACHE_DB", "llm_cache.sqlite3"),
+    disk_max_bytes=int(os.getenv("LLM_CACHE_DISK_BYTES", 256 * 1024 * 1024)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+)
+
+# semaphore is created lazily so that it binds to the running event loop
+_semaphore = None
+
+# retries are handled by the scheduler, so the clients don't retry on their own
+def get_client() -> OpenAI:
+
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
+
+# the connection pool of the async client keeps a connection open for every call allowed in flight
+def get_async_client() -> AsyncOpenAI:
+
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency))
+        )
+    return _async_client
+
+# function to open a connection to the provider ahead of the first model call, listing the models costs no tokens
+async def warm_up_client():
+
+    if not llm_warmup:
+        return
+
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(get_async_client().models.list(), timeout=llm_warmup_timeout)
+        print(f"Model client warmed up in {time.perf_counter() - start:.2f} seconds")
+    except Exception as e:
+        print(f"Model client warm up failed, the first call will connect : {str(e)}")
+
+# the connections are bound to the event loop that opened them, so the client is closed with its loop
+# and a new one is created on the next call
+async def close_async_client():
+
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+system_prompt = """
     You are a world-class AI system, capable of complex reasoning and iterative reflection. For every query, follow this structured process:
 
     1. Thinking Phase:
@@ -33,30 +114,117 @@ def generate_response(query):
     4. Final Output:
     - Repeat Thinking, Reflection and Rethinking phase(at least 2 times and at max 3 times) until you are satisifed with the response and it meets every requirement of the query.  
     - Provide your finalized response inside <output> tags, ensuring it is clear, concise, and actionable."""
-    
-    while attempt <= max_retries:
-        try:
-            result = client.chat.completions.create(
-                    model='gpt-4o',
-                    messages=[{"role":"system", "content":system_prompt},
-                             {"role":"user", "content":query}],
-                    temperature=0, 
-                    store= False,
-                    max_tokens = 4096,
-                    response_format = {"type":"json_object"})
-
-            result = result.choices[0].message.content
-            print('\n','#'*20)
-            print('Raw response: ', result)
-            print('#'*20,'\n')
-            return result
-    
-        except Exception as e:
-            print(e)
-            attempt += 1
-            print('OpenAI Response Error while generating response!!')
+
+# scoring modes: "reflective" sends the reasoning system prompt above and lets the model answer with any JSON object,
+# "lean" sends a minimal system prompt, asks for structured output following a strict JSON schema and caps the
+# completion tokens, which cuts the input overhead and the output tokens of every scoring call
+scoring_modes = ["reflective", "lean"]
+default_scoring_mode = os.getenv("SCORING_MODE", "reflective")
+
+lean_system_prompt = "You score candidates' resumes against job criteria. Answer only with the requested JSON."
+
+# completion tokens allowed per scored resume in lean mode
+lean_max_tokens = int(os.getenv("LEAN_MAX_TOKENS", "256"))
+
+# keyword arguments sent to the chat completions API for a query
+# with a response schema the query is sent in lean mode, max_tokens should then be set for the expected output
+def get_request_params(query, response_schema=None, max_tokens=4096, model=None):
+
+    if response_schema is not None:
+        return dict(
+            model=model or default_model,
+            messages=[{"role":"system", "content":lean_system_prompt},
+                     {"role":"user", "content":query}],
+            temperature=0,
+            store=False,
+            max_tokens=max_tokens,
+            response_format={"type":"json_schema", "json_schema":{"name":"scores", "strict":True, "schema":response_schema}})
+
+    return dict(
+        model=model or default_model,
+        messages=[{"role":"system", "content":system_prompt},
+                 {"role":"user", "content":query}],
+        temperature=0, 
+        store= False,
+        max_tokens = max_tokens,
+        response_format = {"type":"json_object"})
+
+# cache key made of the model and a hash of every request parameter, including the prompts
+def get_cache_key(query, **options):
+
+    params = get_request_params(query, **options)
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"{params['model']}:{digest}"
+
+async def get_cached_response(query, **options):
+
+    if not cache_enabled:
+        return None
+
+    result = await response_cache.get_async(get_cache_key(query, **options))
+    if result is not None:
+        print('Using cached response')
+    return result
+
+# should only be called once the response has passed validation, so a bad answer is never served from the cache
+# options are the request options the query was sent with (see get_request_params)
+async def cache_response(query, result, **options):
+
+    if cache_enabled:
+        await response_cache.set_async(get_cache_key(query, **options), result)
+
+def get_semaphore():
+
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max_concurrency)
+    return _semaphore
+
+# rough estimate of the tokens counted against the tokens per minute limit, the provider counts max_tokens as well
+def estimate_tokens(params):
+
+    return sum(len(message["content"]) for message in params["messages"]) // 4 + params.get("max_tokens", 0)
+
+# function to log the raw response of a model call, only when trace logs are turned on
+def log_response(purpose, result):
+
+    if trace_logs:
+        print(json.dumps({"purpose": purpose, "raw_response": result}))
+
+# function that takes prompt as input and generate the result without blocking the event loop, purpose labels the call in the metrics
+# options are passed on to get_request_params (response_schema and max_tokens for lean mode, model)
+# the number of concurrent model calls is limited with a shared semaphore
+# transient provider errors are retried by the scheduler, LLMUnavailableError is raised once it gives up
+async def generate_response_async(query, purpose="other", **options):
+
+    cached = await get_cached_response(query, **options)
+    if cached is not None:
+        record_cache_hit(purpose)
+        return cached
+
+    params = get_request_params(query, **options)
+
+    # the semaphore is only held during the call itself, not while waiting to retry
+    async def call():
+        async with get_semaphore():
+            return await get_async_client().chat.completions.create(**params)
+
+    start = time.perf_counter()
+    try:
+        result = await scheduler.run_async(call, estimate_tokens(params))
+    except Exception:
+        record_llm_call(purpose, params["model"], time.perf_counter() - start, "error")
+        raise
+    record_llm_call(purpose, params["model"], time.perf_counter() - start, "success", result.usage)
+
+    result = result.choices[0].message.content
+    log_response(purpose, result)
+    return result
             
             
+# the prompts keep what is shared by the calls of a job first and the per-call content (job description, criteria, resumes)
+# last, so the provider's prompt caching can reuse the common prefix of the calls
+
 # prompt to extract the criteria from the Job description
 def get_ranking_criteria_prompt(content, error_correction_prompt = ""):
 
@@ -66,9 +234,7 @@ Your task is to analyze the provided job description and extract **ranking crite
 These criteria should be directly based on the job description and may include **skills, certifications, experience, qualifications, etc.** 
 
 The extracted criteria will be used to rank employees and determine the best fit for the job.
-
-Here is the job description:
-{content}
+The job description is given at the end, inside the job_description tags.
 </context>
 
 <format>
@@ -92,6 +258,10 @@ OUTPUT REQUIREMENTS:
 - If the role is technical, then give importance to technical criteria and discard non-technical stuff and vice-versa.
 </rules>
 
+<job_description>
+{content}
+</job_description>
+
 {error_correction_prompt}
 """
 
@@ -104,8 +274,7 @@ def get_criteria_header_prompt(criteria_list, error_correction_prompt = ""):
     prompt = f"""<context>
 You are an expert at generating criteria headers from given criteria which are used to determine how fit a candidate is for a job.
 The criteria has been extracted from the job description.
-
-Here's the list of criteria: {criteria_list}
+The list of criteria is given at the end, inside the criteria tags.
 </context>
 
 <format_guidelines>
@@ -151,6 +320,10 @@ Response:
 - Also, the criteria header should convey the same meaning as the criteria, so it should be accurate and not too lengthy.
 </rules>
 
+<criteria>
+Here's the list of criteria: {criteria_list}
+</criteria>
+
 {error_correction_prompt}
 """
     
@@ -162,10 +335,9 @@ def get_scoring_prompt(content, criteria_headers, error_correction_prompt = ""):
     prompt = f"""<context>
 You are an expert at evaluating candidate's resume content based on the provided criteria. 
 Your task is given a candidate's resume content and criteria(along with its headers), you need to score the candidate by analyzing the resume content on each criteria out of 10.
+The candidate's resume content is given at the end, inside the resume tags.
 
-Here's the candidate's resume content: {content}
-
-And here's the criteria along with the headers: {criteria_headers}
+Here's the criteria along with the headers: {criteria_headers}
 </context>
 
 <scoring_guidelines>
@@ -223,7 +395,140 @@ Response:
    - Document clear shortfalls with lower scores
 </rules>
 
+<resume>
+{content}
+</resume>
+
+{error_correction_prompt}
+"""
+    
+    return prompt
+
+# prompt to get scores on several resumes in a single request, contents maps a resume id to its content
+def get_batch_scoring_prompt(contents, criteria_headers, error_correction_prompt = ""):
+
+    resumes = "\n\n".join(f'<resume id="{resume_id}">\n{content}\n</resume>' for resume_id, content in contents.items())
+
+    prompt = f"""<context>
+You are an expert at evaluating candidate's resume content based on the provided criteria. 
+Your task is given several candidates' resume contents and criteria(along with its headers), you need to score every candidate independently by analyzing their resume content on each criteria.
+The candidates' resume contents are given at the end, each one is wrapped in a resume tag with its id.
+
+Here's the criteria along with the headers: {criteria_headers}
+</context>
+
+<scoring_guidelines>
+- 5: Exceeds requirement significantly
+- 4: Fully meets requirement with additional relevant experience
+- 3: Meets basic requirement
+- 2: Partially meets requirement
+- 1: Minimal relevant experience
+- 0: No relevant experience OR No information available to assess
+</scoring_guidelines>
+
+<format>
+Response format:
+{{
+    "candidates": {{
+        "Resume id": {{
+            "Candidate Name": "Extract the name of the candidate from the resume",
+            "Criterion 1 Header": score,
+            "Criterion 2 Header": score
+            // ... for all criteria
+        }}
+        // ... for all resumes
+    }}
+}}
+</format>
+
+<example>
+Resume contents: <resume id="Resume A">
+John Doe - Software Engineer
+5 years of Python development experience at Tech Corp
+Masters in Computer Science
+Implemented ML models for classification
+</resume>
+
+<resume id="Resume B">
+Jane Smith - Data Analyst
+2 years of Python scripting for reporting
+Certified in XYZ
+</resume>
+
+Criteria headers: {{
+    "Must have certification XYZ": "Certification XYZ",
+    "5+ years of experience in Python development": "Python Experience",
+    "Strong background in Machine Learning": "Machine Learning"
+}}
+
+Response:
+{{
+    "candidates": {{
+        "Resume A": {{
+            "Candidate Name": "John Doe",
+            "Certification XYZ": 0,
+            "Python Experience": 4,
+            "Machine Learning": 3
+        }},
+        "Resume B": {{
+            "Candidate Name": "Jane Smith",
+            "Certification XYZ": 5,
+            "Python Experience": 2,
+            "Machine Learning": 0
+        }}
+    }}
+}}
+</example>
+
+<rules>
+1. Output must be valid JSON only, with no additional text
+2. Return an entry for every resume id, using the exact id from the resume tag as the key
+3. Score every candidate only on their own resume content, never mix information between resumes
+4. Evaluate all criteria even if not mentioned in resume
+5. Return scores in same order as provided criteria
+6. Use the criteria headers exactly as provided as the keys of the scores
+7. Scoring rules:
+   - Use whole numbers from 0 to 5
+   - Don't make assumptions about unstated experience/skills
+8. For partial matches:
+   - Score proportionally to how well requirement is met
+   - Document clear shortfalls with lower scores
+</rules>
+
+{resumes}
+
 {error_correction_prompt}
 """
     
-    return prompt
\ No newline at end of file
+    return prompt
+
+# JSON schema of the scores of a single candidate, as asked by the scoring prompt, for the lean mode's structured output
+def get_scores_schema(criteria_headers):
+
+    headers = list(criteria_headers.values())
+    return {
+        "type": "object",
+        "properties": {
+            "Candidate Name": {"type": "string"},
+            **{header: {"type": "integer", "enum": [0, 1, 2, 3, 4, 5]} for header in headers}
+        },
+        "required": ["Candidate Name", *headers],
+        "additionalProperties": False
+    }
+
+# JSON schema of the batch scoring response, every resume id maps to the scores of its candidate
+def get_batch_scores_schema(resume_ids, criteria_headers):
+
+    return {
+        "type": "object",
+        "properties": {
+            "candidates": {
+                "type": "object",
+                "properties": {resume_id: get_scores_schema(criteria_headers) for resume_id in resume_ids},
+                "required": list(resume_ids),
+                "additionalProperties": False
+            }
+        },
+        "required": ["candidates"],
+        "additionalProperties": False
+    }
@@ -1,16 +1,55 @@
+import time
+
+# the app modules are timed while they import, the time is logged and reported on /metrics
+import_started = time.perf_counter()
+
 import os
+import re
 import json
-import pandas as pd 
-from fastapi import FastAPI, UploadFile, HTTPException, Form
+import uuid
+import asyncio
+from fastapi import FastAPI, UploadFile, HTTPException, Form, File
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from llm import *
 from utils.helpers import *
-from typing import List
-from models import CriteriaResponse, ErrorResponse, ScoreResponse
+from typing import List, Tuple, Optional
+from contextlib import asynccontextmanager
+from models import CriteriaResponse, ErrorResponse, ScoreResponse, JobResponse, JobResultsResponse, CandidateScores, TokenReport, \
+    MatrixResponse, JobRanking
+from utils.prefilter import lexical_scores, shortlist
+from utils.dedup import find_duplicate_groups
+from utils.uploads import UploadSpool, UploadError, SpooledFile
+from utils.metrics import TraceMiddleware, stage, startup_seconds, get_metrics_output, mark_process_dead
+from prometheus_client import CONTENT_TYPE_LATEST
+from jobs import JobStore, JobWorker, jobs_db, get_job_ranking, CANCELLED
+
+import_seconds = time.perf_counter() - import_started
+startup_seconds.labels("import").set(import_seconds)
+print(f"App modules imported in {import_seconds:.2f} seconds")
 
 allowed_extensions = [".pdf", ".docx"]
 
+job_store = JobStore(jobs_db)
+
+# starting the background job worker with the app, unfinished jobs from a previous run are picked up again
+# the connection to the model provider and the parser workers are started before the first request instead of during it
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    await asyncio.gather(warm_up_client(), warm_up_parser_pool())
+    startup_seconds.labels("warmup").set(time.perf_counter() - start)
+
+    worker = JobWorker(job_store)
+    worker.start()
+    yield
+    await worker.stop()
+    shutdown_parser_pool()
+    await close_async_client()
+    mark_process_dead()
+
 app = FastAPI(
     title="Resume Ranker",
+    lifespan=lifespan,
     description="""
     An API for ranking resumes based on job criteria. The system performs two main functions:
     1. Extracting ranking criteria from job descriptions
@@ -18,6 +57,81 @@ app = FastAPI(
     """
 )
 
+# every request is traced, its stages, model calls and retries end up in the metrics (and the trace logs if enabled)
+app.add_middleware(TraceMiddleware)
+
+# function to check the extensions of every uploaded file before doing any work
+def check_extensions(files: List[UploadFile]):
+
+    for file in files:
+        file_ext = os.path.splitext(file.filename)[1].lower()
+
+        if file_ext not in allowed_extensions:
+            raise HTTPException(
+                status_code = 400,
+                detail = f"{file.filename} has invalid extension. Only {', '.join(allowed_extensions)} are allowed!"
+            )
+
+def check_scoring_mode(scoring_mode: str):
+
+    if scoring_mode not in scoring_modes:
+        raise HTTPException(
+            status_code = 400,
+            detail = f"Invalid scoring mode {scoring_mode}. Only {', '.join(scoring_modes)} are allowed!"
+        )
+
+# function to spool the uploaded resumes, and the resumes inside the uploaded zip archive, to temporary files
+# the spool has to be cleaned up by the caller once the files are extracted
+async def spool_uploads(files: Optional[List[UploadFile]], archive: Optional[UploadFile]) -> Tuple[UploadSpool, List[SpooledFile]]:
+
+    files = files or []
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="No resumes were uploaded!")
+
+    # checking if the uploaded files are valid through extracted extensions before doing any work
+    check_extensions(files)
+    if archive is not None and os.path.splitext(archive.filename)[1].lower() != ".zip":
+        raise HTTPException(status_code=400, detail=f"{archive.filename} has invalid extension. Only .zip archives are allowed!")
+
+    spool = UploadSpool(allowed_extensions)
+    try:
+        with stage("upload"):
+            spooled = [await spool.add_upload(file) for file in files]
+            if archive is not None:
+                spooled += await spool.add_archive(archive)
+
+    except UploadError as e:
+        spool.cleanup()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    except BaseException:
+        spool.cleanup()
+        raise
+
+    return spool, spooled
+
+# function to extract and compact the text of the spooled resumes, returns (filename, text) pairs along
+# with the tokens of every resume before and after compaction, resumes whose content couldn't be extracted are skipped
+async def read_resumes(spooled: List[SpooledFile]) -> Tuple[List[Tuple[str, str]], List[TokenReport]]:
+
+    # Extract text based on file type, parsing happens in parallel on the worker processes which open the files by path
+    with stage("extraction"):
+        extracted = await asyncio.gather(*[extract_content_from_path(file.file_ext, file.path, file.key) for file in spooled])
+
+    resumes = []
+    token_report = []
+    with stage("compaction"):
+        for file, text_content in zip(spooled, extracted):
+            if text_content is None:
+                print(f"Skipping {file.filename} as its content couldn't be extracted")
+                continue
+
+            text_content, tokens_before, tokens_after = compact_resume_text(text_content)
+            resumes.append((file.filename, text_content))
+            token_report.append(TokenReport(file=file.filename, tokens_before=tokens_before, tokens_after=tokens_after))
+
+    return resumes, token_report
+
 @app.get("/",
     summary="Root endpoint",
     description="Returns a welcome message to confirm the API is running.",
@@ -26,6 +140,23 @@ app = FastAPI(
 def root():
     return {"message":"Welcome to Resume Ranker"}
 
+@app.get("/cache-stats",
+    summary="Cache statistics",
+    description="Returns hit/miss counters and sizes of the caches used while processing documents.",
+    response_description="Cache statistics"
+)
+def cache_stats():
+    return {"extraction": extraction_cache.stats(), "llm": response_cache.stats()}
+
+@app.get("/metrics",
+    summary="Prometheus metrics",
+    description="Returns the time spent per stage and per request, the model calls, their token usage and the retries by cause in the Prometheus text format.",
+    response_class=Response,
+    responses={200: {"content": {CONTENT_TYPE_LATEST: {}}}}
+)
+def metrics():
+    return Response(get_metrics_output(), media_type=CONTENT_TYPE_LATEST)
+
 # End point to extract criteria from Job descriptions
 @app.post("/extract-criteria",
     summary="Extract ranking criteria from job description",
@@ -49,53 +180,51 @@ async def extract_criteria(file: UploadFile):
             detail = f"{file.filename} has invalid extension. Only {', '.join(allowed_extensions)} are allowed!"
         )
     
-    # read the content if the files are valid
-    content = await file.read()
-    
-    # Extract text based on file type
-    text_content = await extract_content(file_ext, content)
+    # spool the file to disk if it is valid
+    spool, (spooled,) = await spool_uploads([file], None)
 
-    # extract key ranking criteria from job description
-    attempt = 1
-    max_retries = 3
-    error = False
-    error_correction_prompt = ""
+    try:
+        # Extract text based on file type
+        with stage("extraction"):
+            text_content = await extract_content_from_path(spooled.file_ext, spooled.path, spooled.key)
+    finally:
+        spool.cleanup()
 
-    # attempting retry in case of OPENAI error or json error
-    while attempt <= max_retries:
-    
-        try:
-            criteria_response = generate_response(get_ranking_criteria_prompt(text_content, error_correction_prompt))
-            ranking_criteria = json.loads(criteria_response)
-            print(ranking_criteria)
-            error = False
-            break
-
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {str(e)}")
-            error_correction_prompt = "In the previous iteration, you failed to return a valid JSON response, please make sure the response is in the JSON format as mentioned."
-            attempt += 1
-            error = True
-            continue
-
-        except Exception as e:
-            print(f"Error in generating response : {str(e)}")
-            attempt += 1
-            error = True
-            continue
-
-    if error:
-        ranking_criteria = {"Error": "Failed to generate a response, please try again!!"}
-
-    return ranking_criteria
+    if text_content is None:
+        raise HTTPException(
+            status_code = 400,
+            detail = f"Failed to extract text from {file.filename}!"
+        )
+
+    # extract key ranking criteria from job description
+    with stage("criteria_extraction"):
+        return await generate_ranking_criteria(text_content)
 
 # Endpoint to score the resumes using the extracted criteria
 @app.post("/score-resumes",
     summary="Score resumes against criteria",
     description="""
     Scores multiple resumes against provided ranking criteria.
-    Supports PDF and DOCX resume files.
-    Returns scores for each candidate across all criteria and saves results to CSV.
+    Supports PDF and DOCX resume files, uploaded as files and/or as a single .zip archive of resumes.
+    Uploads are limited in size per file (MAX_UPLOAD_FILE_BYTES) and per request (MAX_UPLOAD_REQUEST_BYTES).
+    Returns scores for each candidate across all criteria and saves the ranking table to a file of the request,
+    which can be downloaded from /results/{request_id}. The output_format can be csv (default), parquet or json,
+    json also returns the ranking in the response body. With top_k, only the top_k best candidates are kept.
+    With batch_size above 1, that many resumes are scored together in a single model call,
+    batches that fail validation are split and retried in smaller batches.
+    The scoring_mode is reflective (default, set with SCORING_MODE) or lean. Lean calls use a minimal system prompt,
+    structured output following the JSON schema of the scores and a small completion budget, they are faster and cheaper.
+
+    With cascade, every resume is first scored by a smaller model (CASCADE_FIRST_MODEL). Only the resumes it failed on
+    and the ones whose total score is within CASCADE_BAND points of the top_k cutoff (CASCADE_TOP_K without top_k)
+    are scored again by the stronger model (CASCADE_SECOND_MODEL). The cascade_report gives the resumes and model calls of each tier.
+
+    Optionally, a lexical (BM25) pre-filter shortlists resumes before they are sent to the model:
+    only resumes with a lexical score of at least prefilter_min_score (0 to 1) are kept, and only the
+    prefilter_top_n best of them. Skipped resumes are listed by file name with their lexical score only.
+
+    Near-duplicate resumes (RESUME_DEDUP, similarity of at least DEDUP_THRESHOLD) are scored once and share
+    the scores of their group, candidates with duplicates are flagged with their group in the Duplicate Group column.
     
     The scoring is done on a scale of 0-5:
     - 5: Exceeds requirement significantly
@@ -108,79 +237,436 @@ async def extract_criteria(file: UploadFile):
     response_model=ScoreResponse,
     responses={
         200: {"model": ScoreResponse},
-        400: {"model": ErrorResponse}
+        400: {"model": ErrorResponse},
+        413: {"model": ErrorResponse}
     }
 )
-async def score_resumes(files: List[UploadFile], criteria: str = Form(...)):
+async def score_resumes(files: Optional[List[UploadFile]] = File(None), archive: Optional[UploadFile] = File(None),
+                        criteria: str = Form(...), batch_size: int = Form(1), scoring_mode: str = Form(default_scoring_mode),
+                        prefilter_top_n: Optional[int] = Form(None), prefilter_min_score: Optional[float] = Form(None),
+                        output_format: str = Form("csv"), top_k: Optional[int] = Form(None), cascade: bool = Form(False)):
     
     print("#"*30)
-    
+
+    if output_format not in output_formats:
+        raise HTTPException(
+            status_code = 400,
+            detail = f"Invalid output format {output_format}. Only {', '.join(output_formats)} are allowed!"
+        )
+    check_scoring_mode(scoring_mode)
+
+    request_id = uuid.uuid4().hex
+
+    # the criteria are checked before spooling, so an invalid request leaves no uploads behind
     try:
         # Convert criteria string to list
         criteria_dict = json.loads(criteria)
 
     except json.JSONDecodeError:
         return ScoreResponse(message = "Invalid input JSON format for criteria!!")
-        
+
+    spool, spooled = await spool_uploads(files, archive)
+
     try:
         # get criteria headers from criteria
-        criteria_headers = await get_criteria_headers(criteria_dict["criteria"])
+        with stage("criteria_headers"):
+            criteria_headers = await get_criteria_headers(criteria_dict["criteria"])
         if "Error" in criteria_headers.criteria_headers:
             return ScoreResponse(message="Failed to process due to criteria headers error")
 
-        # dataframe to store results
-        header_cols = ['Candidate Name'] + list(criteria_headers.criteria_headers.values())
-        score_df = pd.DataFrame(columns=header_cols)
+        resumes, token_report = await read_resumes(spooled)
+        contents = [text_content for _, text_content in resumes]
 
-        # iterating over each resume and storing the content
-        for file in files:
-        
-            file_ext = os.path.splitext(file.filename)[1].lower()
-
-            # checking if the uploaded files are valid through extracted extensions
-            if file_ext not in allowed_extensions:
-                raise HTTPException(
-                    status_code = 400,
-                    detail = f"{file.filename} has invalid extension. Only {', '.join(allowed_extensions)} are allowed!"
-                )
-            
-            # read the content if the files are valid
-            content = await file.read()
-            
-            # Extract text based on file type
-            text_content = await extract_content(file_ext, content)
-
-            # send the extracted resume content along with criteria to generate scores
-            scores_response = await get_candidate_scores(text_content, criteria_headers.criteria_headers)
-
-            if scores_response.Candidate_Name == "Error":
-                continue
+        # shortlisting the resumes that have some overlap with the criteria before sending them to the model
+        resume_lexical_scores = None
+        shortlisted = list(range(len(contents)))
+        if prefilter_top_n is not None or prefilter_min_score is not None:
+            with stage("prefilter"):
+                resume_lexical_scores = lexical_scores(contents, criteria_dict["criteria"])
+                shortlisted = shortlist(resume_lexical_scores, prefilter_top_n, prefilter_min_score)
+            print(f"{len(shortlisted)} out of {len(contents)} resumes shortlisted by the pre-filter")
+
+        # grouping near-duplicate resumes, every resume is in the group of the first resume it duplicates
+        duplicate_groups = None
+        if dedup_enabled:
+            with stage("dedup"):
+                duplicate_groups = find_duplicate_groups(contents, dedup_threshold)
 
-            # Create a row with the correct column order using model attributes
-            row_data = {
-                'Candidate Name': scores_response.Candidate_Name,
-                **scores_response.scores  # Unpack the scores dictionary
-            }
+        # send the extracted resume contents along with criteria to generate scores concurrently, duplicates are scored once
+        with stage("scoring"):
+            shortlisted_groups = [duplicate_groups[index] for index in shortlisted] if duplicate_groups is not None else shortlisted
+            scored_contents = [contents[shortlisted[position]] for position in get_group_representatives(shortlisted_groups)]
 
-            # in case the returned output is not the right order of columns, lets reorder it
-            ordered_row = {col: row_data.get(col, None) for col in score_df.columns}
+            cascade_report = None
+            if cascade:
+                scored, cascade_report = await get_cascade_scores(scored_contents, criteria_headers.criteria_headers, batch_size, scoring_mode, top_k)
+            else:
+                scored = await get_all_candidate_scores(scored_contents, criteria_headers.criteria_headers, batch_size, scoring_mode)
 
-            # Add the row to DataFrame
-            score_df.loc[len(score_df)] = ordered_row
+            shortlisted_scores = share_group_scores(scored, shortlisted_groups)
 
-        if len(score_df) == 0:
-            return ScoreResponse(message="No valid resumes were processed successfully")
+        # resumes skipped by the pre-filter are listed under their file name without scores
+        all_scores = [CandidateScores(Candidate_Name=filename, scores={}) for filename, _ in resumes]
+        for index, scores_response in zip(shortlisted, shortlisted_scores):
+            all_scores[index] = scores_response
 
-        # getting total score
-        score_df["Total Score"] = score_df.iloc[:, 1:].sum(axis=1)
+        # ranking table sorted on total score, resumes that failed to score are left out
+        with stage("ranking"):
+            score_df = build_score_table(all_scores, criteria_headers.criteria_headers, resume_lexical_scores, top_k, duplicate_groups)
 
-        # sorting the dataframe on total score
-        score_df.sort_values(by = 'Total Score', ascending = False, inplace = True, ignore_index = True)
+            if len(score_df) == 0:
+                return ScoreResponse(message="No valid resumes were processed successfully", token_report=token_report, cascade_report=cascade_report)
 
-        score_df.to_csv("Resume scorer card.csv", index=False)
+            output_path = save_score_table(score_df, request_id, output_format)
         
-        return ScoreResponse(message="Scores are successfully generated and saved in csv file.")
+        return ScoreResponse(
+            message=f"Scores are successfully generated and saved in {output_format} file.",
+            request_id=request_id,
+            output_path=output_path,
+            results=json.loads(score_df.to_json(orient="records")) if output_format == "json" else None,
+            token_report=token_report,
+            cascade_report=cascade_report
+        )
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return ScoreResponse(message="Failed to process resumes due to an error")
+
+    finally:
+        spool.cleanup()
+
+# function to name the job of every job description in the score matrix after its file, names used twice are numbered
+def get_job_names(filenames: List[str]) -> List[str]:
+
+    names = []
+    for filename in filenames:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        unique_name = name
+        number = 2
+        while unique_name in names:
+            unique_name = f"{name} {number}"
+            number += 1
+        names.append(unique_name)
+
+    return names
+
+# Endpoint to score a pool of resumes against several job descriptions at once
+@app.post("/score-matrix",
+    summary="Score resumes against several job descriptions",
+    description="""
+    Scores a pool of resumes against several job descriptions (PDF/DOCX) in a single request.
+    Every document is parsed once. The criteria of every job description are extracted concurrently and the
+    resumes are scored once against the criteria of all the jobs together, criteria shared by jobs are scored once.
+    Returns the total score of every candidate for every job (the score matrix) along with the ranking of every job.
+    The matrix is saved as score_matrix and the ranking of the n-th job description as ranking_n, both can be
+    downloaded from /results/{request_id}?name=... The output_format, top_k, batch_size and scoring_mode
+    work as in /score-resumes, top_k applies to the ranking of every job.
+    """,
+    response_model=MatrixResponse,
+    responses={
+        200: {"model": MatrixResponse},
+        400: {"model": ErrorResponse},
+        413: {"model": ErrorResponse}
+    }
+)
+async def score_matrix(job_descriptions: List[UploadFile] = File(...), files: Optional[List[UploadFile]] = File(None),
+                       archive: Optional[UploadFile] = File(None), batch_size: int = Form(1),
+                       scoring_mode: str = Form(default_scoring_mode), output_format: str = Form("csv"), top_k: Optional[int] = Form(None)):
+
+    print("#"*30)
+
+    if output_format not in output_formats:
+        raise HTTPException(
+            status_code = 400,
+            detail = f"Invalid output format {output_format}. Only {', '.join(output_formats)} are allowed!"
+        )
+    check_scoring_mode(scoring_mode)
+
+    request_id = uuid.uuid4().hex
+
+    job_spool, job_spooled = await spool_uploads(job_descriptions, None)
+    try:
+        spool, spooled = await spool_uploads(files, archive)
+    except BaseException:
+        job_spool.cleanup()
+        raise
+
+    try:
+        # job descriptions and resumes are parsed once, together
+        with stage("extraction"):
+            job_texts, (resumes, token_report) = await asyncio.gather(
+                asyncio.gather(*[extract_content_from_path(file.file_ext, file.path, file.key) for file in job_spooled]),
+                read_resumes(spooled)
+            )
+
+        for file, text_content in zip(job_spooled, job_texts):
+            if text_content is None:
+                return MatrixResponse(message=f"Failed to extract text from {file.filename}!")
+
+        # criteria of every job are extracted concurrently
+        with stage("criteria_extraction"):
+            job_criteria = await asyncio.gather(*[generate_ranking_criteria(text_content) for text_content in job_texts])
+
+        for file, criteria_response in zip(job_spooled, job_criteria):
+            if "criteria" not in criteria_response:
+                return MatrixResponse(message=f"Failed to extract the criteria of {file.filename}")
+        job_criteria = [criteria_response["criteria"] for criteria_response in job_criteria]
+
+        # headers are generated for the criteria of all the jobs together, so a header always means the same criterion
+        with stage("criteria_headers"):
+            criteria_headers = await get_criteria_headers(merge_criteria(job_criteria))
+        if "Error" in criteria_headers.criteria_headers:
+            return MatrixResponse(message="Failed to process due to criteria headers error")
+        merged_headers = criteria_headers.criteria_headers
+
+        contents = [text_content for _, text_content in resumes]
+
+        duplicate_groups = None
+        if dedup_enabled:
+            with stage("dedup"):
+                duplicate_groups = find_duplicate_groups(contents, dedup_threshold)
+
+        # every resume is scored once on the criteria of all the jobs, duplicates are scored once
+        with stage("scoring"):
+            groups = duplicate_groups if duplicate_groups is not None else list(range(len(contents)))
+            scored = await get_all_candidate_scores([contents[index] for index in get_group_representatives(groups)],
+                                                    merged_headers, batch_size, scoring_mode)
+            all_scores = share_group_scores(scored, groups)
+
+        with stage("ranking"):
+            job_names = get_job_names([file.filename for file in job_spooled])
+            job_headers = {name: {criterion: merged_headers[criterion] for criterion in criteria}
+                           for name, criteria in zip(job_names, job_criteria)}
+
+            matrix_df = build_score_matrix(all_scores, [filename for filename, _ in resumes], job_headers)
+            if len(matrix_df) == 0:
+                return MatrixResponse(message="No valid resumes were processed successfully", token_report=token_report)
+            output_path = save_score_table(matrix_df, request_id, output_format, "score_matrix")
+
+            # the ranking of every job only looks at the scores of its own criteria
+            job_rankings = []
+            for number, (file, name, criteria) in enumerate(zip(job_spooled, job_names, job_criteria), start=1):
+                score_df = build_score_table(all_scores, job_headers[name], top_k=top_k, duplicate_groups=duplicate_groups)
+                job_rankings.append(JobRanking(
+                    job_description=file.filename,
+                    job=name,
+                    criteria=criteria,
+                    output_path=save_score_table(score_df, request_id, output_format, f"ranking_{number}"),
+                    ranking=json.loads(score_df.to_json(orient="records")) if output_format == "json" else None
+                ))
+
+        return MatrixResponse(
+            message=f"Scores of {len(matrix_df)} candidates for {len(job_names)} jobs are successfully generated and saved in {output_format} files.",
+            request_id=request_id,
+            output_path=output_path,
+            matrix=json.loads(matrix_df.to_json(orient="records")) if output_format == "json" else None,
+            job_rankings=job_rankings,
+            token_report=token_report
+        )
 
     except Exception as e:
         print(f"Error: {str(e)}")
-        return ScoreResponse(message="Failed to process resumes due to an error")
\ No newline at end of file
+        return MatrixResponse(message="Failed to process resumes due to an error")
+
+    finally:
+        job_spool.cleanup()
+        spool.cleanup()
+
+output_media_types = {"json": "application/json", "csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Endpoint to download the ranking table saved by /score-resumes, or the files saved by /score-matrix
+@app.get("/results/{request_id}",
+    summary="Download the ranking table of a scoring request",
+    description="""
+    Returns the file saved by /score-resumes for the given request ID, in the output format of that request.
+    For /score-matrix requests, name selects the file: score_matrix (default) or ranking_n for the n-th job description.
+    """,
+    responses={
+        200: {"content": {"text/csv": {}, "application/json": {}, "application/vnd.apache.parquet": {}}},
+        404: {"model": ErrorResponse}
+    }
+)
+def get_results(request_id: str, name: Optional[str] = None):
+
+    # the request ID is used as a directory name, so anything but a plain hex ID is rejected
+    if not re.fullmatch(r"[0-9a-f]{32}", request_id):
+        raise HTTPException(status_code=404, detail=f"No results found for {request_id}!")
+    if name is not None and not re.fullmatch(r"resume_scores|score_matrix|ranking_\d+", name):
+        raise HTTPException(status_code=404, detail=f"No results found for {request_id}!")
+
+    for file_name in [name] if name is not None else ["resume_scores", "score_matrix"]:
+        for output_format in output_formats:
+            path = get_output_path(request_id, output_format, file_name)
+            if os.path.exists(path):
+                return FileResponse(path, filename=os.path.basename(path), media_type=output_media_types[output_format])
+
+    raise HTTPException(status_code=404, detail=f"No results found for {request_id}!")
+
+# Endpoint to score the resumes and stream every candidate's scores as soon as they are ready
+@app.post("/score-resumes/stream",
+    summary="Score resumes against criteria and stream the results",
+    description="""
+    Takes the files, archive, criteria, batch_size and scoring_mode of /score-resumes, and streams the response as newline delimited JSON (NDJSON).
+    A "candidate" event is sent for every resume as soon as it is scored, in completion order:
+    {"event": "candidate", "index": 0, "file": "resume.pdf", "result": {"Candidate_Name": "...", "scores": {...}}}
+    Resumes that failed to score have "Error" as the candidate name and empty scores.
+    A final "summary" event carries the ranking sorted on total score:
+    {"event": "summary", "ranking": [{"Candidate Name": "...", "Header": 4, "Total Score": 4}, ...]}
+    Near-duplicate resumes are scored once, the events of a group are sent together once its first resume is scored.
+    """,
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        400: {"model": ErrorResponse}
+    }
+)
+async def score_resumes_stream(files: Optional[List[UploadFile]] = File(None), archive: Optional[UploadFile] = File(None),
+                               criteria: str = Form(...), batch_size: int = Form(1), scoring_mode: str = Form(default_scoring_mode)):
+
+    try:
+        # Convert criteria string to list
+        criteria_list = json.loads(criteria)["criteria"]
+
+    except (json.JSONDecodeError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid input JSON format for criteria!!")
+    check_scoring_mode(scoring_mode)
+
+    spool, spooled = await spool_uploads(files, archive)
+
+    try:
+        with stage("criteria_headers"):
+            criteria_headers = await get_criteria_headers(criteria_list)
+        if "Error" in criteria_headers.criteria_headers:
+            raise HTTPException(status_code=502, detail="Failed to process due to criteria headers error")
+
+        # resumes are extracted before streaming starts, so the spooled files can be removed right away
+        resumes, token_report = await read_resumes(spooled)
+    finally:
+        spool.cleanup()
+
+    contents = [text for _, text in resumes]
+
+    # only the first resume of every group of near-duplicates is scored
+    duplicate_groups = None
+    if dedup_enabled:
+        with stage("dedup"):
+            duplicate_groups = find_duplicate_groups(contents, dedup_threshold)
+    group_members = {}
+    for index in range(len(contents)):
+        group_members.setdefault(duplicate_groups[index] if duplicate_groups is not None else index, []).append(index)
+    representatives = list(group_members.keys())
+
+    async def events():
+        all_scores = [None] * len(resumes)
+
+        with stage("scoring"):
+            async for position, scores_response in iter_candidate_scores([contents[index] for index in representatives], criteria_headers.criteria_headers,
+                                                                   batch_size, scoring_mode):
+                for index in group_members[representatives[position]]:
+                    all_scores[index] = scores_response
+                    yield json.dumps({
+                        "event": "candidate",
+                        "index": index,
+                        "file": resumes[index][0],
+                        "tokens": token_report[index].model_dump(),
+                        "result": scores_response.model_dump()
+                    }) + "\n"
+
+        with stage("ranking"):
+            score_df = build_score_table(all_scores, criteria_headers.criteria_headers, duplicate_groups=duplicate_groups)
+        yield json.dumps({"event": "summary", "ranking": json.loads(score_df.to_json(orient="records"))}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+# function to build the response of a job from its stored state
+def get_job_response(job_id: str) -> dict:
+
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found!")
+
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "total": job["total"],
+        "scored": job["scored"],
+        "failed": job["failed"],
+        "error": job["error"]
+    }
+
+# Endpoint to submit a scoring job that runs in the background
+@app.post("/jobs",
+    summary="Submit a resume scoring job",
+    description="""
+    Takes the files, archive, criteria, batch_size and scoring_mode of /score-resumes, the resumes are scored in the background and the job ID is returned right away.
+    Use GET /jobs/{job_id} to follow the progress and GET /jobs/{job_id}/results to fetch the partial or final ranking.
+    Every scored resume is checkpointed, so an interrupted job continues where it stopped after a restart.
+    """,
+    response_model=JobResponse,
+    responses={
+        200: {"model": JobResponse},
+        400: {"model": ErrorResponse},
+        413: {"model": ErrorResponse}
+    }
+)
+async def submit_job(files: Optional[List[UploadFile]] = File(None), archive: Optional[UploadFile] = File(None),
+                     criteria: str = Form(...), batch_size: int = Form(1), scoring_mode: str = Form(default_scoring_mode)):
+
+    try:
+        # Convert criteria string to list
+        criteria_list = json.loads(criteria)["criteria"]
+
+    except (json.JSONDecodeError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid input JSON format for criteria!!")
+    check_scoring_mode(scoring_mode)
+
+    spool, spooled = await spool_uploads(files, archive)
+
+    try:
+        # the spooled files are copied into the job store in chunks, in a thread so the event loop isn't blocked meanwhile
+        job_id = await asyncio.to_thread(job_store.create_job, criteria_list, batch_size, scoring_mode,
+                                         [(file.filename, file.file_ext, file.path) for file in spooled])
+    finally:
+        spool.cleanup()
+
+    return get_job_response(job_id)
+
+@app.get("/jobs/{job_id}",
+    summary="Get the progress of a scoring job",
+    response_model=JobResponse,
+    responses={
+        200: {"model": JobResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+def get_job(job_id: str):
+    return get_job_response(job_id)
+
+@app.get("/jobs/{job_id}/results",
+    summary="Get the ranking of a scoring job",
+    description="Returns the scores of the resumes scored so far sorted on total score, the ranking is final once the job is completed.",
+    response_model=JobResultsResponse,
+    responses={
+        200: {"model": JobResultsResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+def get_job_results(job_id: str):
+
+    job_response = get_job_response(job_id)
+    return {**job_response, "ranking": get_job_ranking(job_store, job_store.get_job(job_id))}
+
+@app.delete("/jobs/{job_id}",
+    summary="Cancel a scoring job",
+    description="Cancels a queued or running job. A running job stops after the resumes currently being scored, the scores so far are kept.",
+    response_model=JobResponse,
+    responses={
+        200: {"model": JobResponse},
+        404: {"model": ErrorResponse}
+    }
+)
+def cancel_job(job_id: str):
+
+    get_job_response(job_id)
+    job_store.finish_job(job_id, CANCELLED)
+    return get_job_response(job_id)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional, Any
 
 class CriteriaResponse(BaseModel):
     criteria: List[str] = Field(..., description="List of extracted criteria from job description")
@@ -7,12 +7,55 @@ class CriteriaResponse(BaseModel):
 class ErrorResponse(BaseModel):
     Error: str = Field(..., description="Error message when processing fails")
 
+class TokenReport(BaseModel):
+    file: str = Field(..., description="Name of the resume file")
+    tokens_before: int = Field(..., description="Tokens of the extracted resume text")
+    tokens_after: int = Field(..., description="Tokens of the resume text sent for scoring, after compaction")
+
+class CascadeTier(BaseModel):
+    tier: int = Field(..., description="Tier of the cascade, 1 scores every resume and 2 the escalated ones")
+    model: str = Field(..., description="Model of the tier")
+    resumes: int = Field(..., description="Number of resumes scored by the tier")
+    llm_calls: int = Field(..., description="Number of model calls made by the tier, retries included")
+    cached_calls: int = Field(..., description="Number of calls of the tier answered from the response cache")
+
 class ScoreResponse(BaseModel):
     message: str = Field(..., description="Success message after processing")
+    request_id: Optional[str] = Field(None, description="ID of the request, used to download its ranking table from /results/{request_id}")
+    output_path: Optional[str] = Field(None, description="Path of the saved ranking table")
+    results: Optional[List[Dict[str, Any]]] = Field(None, description="Ranking table sorted on total score, returned for the json output format")
+    token_report: Optional[List[TokenReport]] = Field(None, description="Tokens of every resume before and after compaction")
+    cascade_report: Optional[List[CascadeTier]] = Field(None, description="Resumes and model calls of every tier, for cascade scoring")
+
+class JobRanking(BaseModel):
+    job_description: str = Field(..., description="Name of the job description file")
+    job: str = Field(..., description="Column of the job in the score matrix")
+    criteria: List[str] = Field(..., description="Criteria extracted from the job description")
+    output_path: Optional[str] = Field(None, description="Path of the saved ranking table of the job")
+    ranking: Optional[List[Dict[str, Any]]] = Field(None, description="Ranking table of the job sorted on total score, returned for the json output format")
+
+class MatrixResponse(BaseModel):
+    message: str = Field(..., description="Success message after processing")
+    request_id: Optional[str] = Field(None, description="ID of the request, used to download its files from /results/{request_id}")
+    output_path: Optional[str] = Field(None, description="Path of the saved score matrix")
+    matrix: Optional[List[Dict[str, Any]]] = Field(None, description="Total score of every candidate for every job, returned for the json output format")
+    job_rankings: Optional[List[JobRanking]] = Field(None, description="Criteria and ranking of every job")
+    token_report: Optional[List[TokenReport]] = Field(None, description="Tokens of every resume before and after compaction")
 
 class CriteriaHeaders(BaseModel):
     criteria_headers: Dict[str, str] = Field(..., description="Mapping of criteria to their headers")
 
 class CandidateScores(BaseModel):
     Candidate_Name: str = Field(..., description="Name of the candidate")
-    scores: Dict[str, int] = Field(..., description="Scores for each criteria") 
\ No newline at end of file
+    scores: Dict[str, int] = Field(..., description="Scores for each criteria") 
+
+class JobResponse(BaseModel):
+    job_id: str = Field(..., description="ID of the scoring job")
+    status: str = Field(..., description="Status of the job: queued, running, completed, failed or cancelled")
+    total: int = Field(..., description="Number of resumes in the job")
+    scored: int = Field(..., description="Number of resumes scored so far")
+    failed: int = Field(..., description="Number of resumes that failed to be scored")
+    error: Optional[str] = Field(None, description="Error message if the job failed")
+
+class JobResultsResponse(JobResponse):
+    ranking: List[Dict[str, Any]] = Field(..., description="Scores of the resumes scored so far, sorted on total score")
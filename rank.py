@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+from llm import max_concurrency, scoring_modes, default_scoring_mode
+from bulk import collect_resume_paths
+from utils.helpers import extract_content_from_path, compact_resume_text, generate_ranking_criteria, get_criteria_headers, \
+    iter_candidate_scores, build_score_table, write_score_table, output_formats, shutdown_parser_pool
+from models import CandidateScores
+
+# Command line ranker for directories of resumes, meant for large backfills that are too big for a single upload.
+# Resumes are parsed in parallel, scored concurrently and every result is appended to a state file (JSON lines),
+# so an interrupted run continues with the resumes that weren't scored yet when it is started again.
+
+# State file kept between runs, the first line holds the criteria and their headers and every following line
+# the result of a resume, null when it couldn't be extracted or scored
+class RankState:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.criteria = None
+        self.criteria_headers = None
+        self.results: Dict[str, Optional[CandidateScores]] = {}
+
+        complete = True
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as state_file:
+                for line in state_file:
+                    complete = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line can be cut short if the previous run was killed while writing it
+                        continue
+                    if "criteria" in entry:
+                        self.criteria = entry["criteria"]
+                        self.criteria_headers = entry["criteria_headers"]
+                    else:
+                        self.results[entry["path"]] = CandidateScores(**entry["result"]) if entry["result"] else None
+
+        self.state_file = open(path, "a", encoding="utf-8")
+        if not complete:
+            # the cut line is ended so the next result starts on a line of its own
+            self.state_file.write("\n")
+
+    def start(self, criteria: List[str], criteria_headers: dict):
+        self.criteria = criteria
+        self.criteria_headers = criteria_headers
+        self.write({"criteria": criteria, "criteria_headers": criteria_headers})
+
+    def save_result(self, path: str, candidate_scores: Optional[CandidateScores]):
+        failed = candidate_scores is None or candidate_scores.Candidate_Name == "Error"
+        self.results[path] = None if failed else candidate_scores
+        self.write({"path": path, "result": None if failed else candidate_scores.model_dump()})
+
+    def write(self, entry: dict):
+        self.state_file.write(json.dumps(entry) + "\n")
+        self.state_file.flush()
+
+    def close(self):
+        self.state_file.close()
+
+# progress line printed after every chunk of resumes
+class Progress:
+
+    def __init__(self, total: int, done: int):
+        self.total = total
+        self.done = done
+        self.started_with = done
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def update(self, done: int, failed: int):
+        self.done += done
+        self.failed += failed
+
+        elapsed = time.monotonic() - self.started
+        rate = (self.done - self.started_with) / elapsed if elapsed > 0 else 0
+        eta = (self.total - self.done) / rate if rate > 0 else 0
+        print(f"Progress: {self.done}/{self.total} resumes ({100 * self.done / max(self.total, 1):.1f}%), "
+              f"{self.failed} failed, {rate:.2f} resumes/s, ETA {time.strftime('%H:%M:%S', time.gmtime(eta))}", file=sys.stderr, flush=True)
+
+# function to get the criteria from a criteria JSON file (as returned by /extract-criteria) or a job description file
+async def load_criteria(criteria_path: Optional[str], job_description_path: Optional[str]) -> List[str]:
+
+    if criteria_path:
+        with open(criteria_path, encoding="utf-8") as criteria_file:
+            return json.load(criteria_file)["criteria"]
+
+    text_content = await extract_content_from_path(os.path.splitext(job_description_path)[1].lower(), job_description_path)
+    if text_content is None:
+        raise SystemExit(f"Failed to extract text from {job_description_path}")
+
+    ranking_criteria = await generate_ranking_criteria(text_content)
+    if "criteria" not in ranking_criteria:
+        raise SystemExit(f"Failed to extract the criteria from {job_description_path}")
+
+    return ranking_criteria["criteria"]
+
+# function to extract and compact the text of a chunk of resumes, None for the resumes that couldn't be extracted
+async def read_chunk(paths: List[str]) -> List[Optional[str]]:
+    extracted = await asyncio.gather(*[extract_content_from_path(os.path.splitext(path)[1].lower(), path) for path in paths])
+    return [compact_resume_text(text_content)[0] if text_content is not None else None for text_content in extracted]
+
+async def rank(resume_paths: List[str], state: RankState, batch_size: int, scoring_mode: str, retry_failed: bool):
+
+    pending = [path for path in resume_paths if path not in state.results or (retry_failed and state.results[path] is None)]
+    progress = Progress(len(resume_paths), len(resume_paths) - len(pending))
+    print(f"{len(resume_paths)} resumes found, {len(pending)} left to score", file=sys.stderr)
+
+    # the next chunk is parsed while the current one is being scored
+    chunk_size = max_concurrency * max(batch_size, 1)
+    chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+    next_chunk = asyncio.create_task(read_chunk(chunks[0])) if chunks else None
+
+    for position, chunk in enumerate(chunks):
+        contents = await next_chunk
+        if position + 1 < len(chunks):
+            next_chunk = asyncio.create_task(read_chunk(chunks[position + 1]))
+
+        parsed = []
+        for path, text_content in zip(chunk, contents):
+            if text_content is None:
+                print(f"Skipping {path} as its content couldn't be extracted")
+                state.save_result(path, None)
+            else:
+                parsed.append((path, text_content))
+
+        async for index, candidate_scores in iter_candidate_scores([text for _, text in parsed], state.criteria_headers, batch_size, scoring_mode):
+            state.save_result(parsed[index][0], candidate_scores)
+
+        progress.update(len(chunk), sum(state.results[path] is None for path in chunk))
+
+async def run(args):
+
+    resume_paths = collect_resume_paths(args.resumes)
+    state = RankState(args.state)
+
+    try:
+        if state.criteria_headers is None:
+            criteria = await load_criteria(args.criteria, args.job_description)
+            headers_response = await get_criteria_headers(criteria)
+            if "Error" in headers_response.criteria_headers:
+                raise SystemExit("Failed to generate criteria headers")
+            state.start(criteria, headers_response.criteria_headers)
+        else:
+            # a resumed run keeps the criteria it was started with
+            if args.criteria and await load_criteria(args.criteria, None) != state.criteria:
+                raise SystemExit(f"{args.state} was started with other criteria, use another state file for the new criteria")
+            print(f"Resuming from {args.state} with {len(state.results)} resumes already processed", file=sys.stderr)
+
+        await rank(resume_paths, state, args.batch_size, args.scoring_mode, args.retry_failed)
+
+    finally:
+        state.close()
+
+    # only the resumes of this run are ranked, even if the state file has results of other files
+    score_df = build_score_table([state.results[path] for path in resume_paths if state.results.get(path) is not None],
+                                 state.criteria_headers, top_k=args.top_k)
+
+    output_format = os.path.splitext(args.output)[1].lower().lstrip(".")
+    write_score_table(score_df, args.output, output_format if output_format in output_formats else "csv")
+    print(f"Ranking table of {len(score_df)} candidates saved to {args.output}", file=sys.stderr)
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Rank a directory of resumes against a job description or a set of criteria")
+    criteria_group = parser.add_mutually_exclusive_group()
+    criteria_group.add_argument("--job-description", help="Job description file (PDF/DOCX) to extract the criteria from")
+    criteria_group.add_argument("--criteria", help="JSON file with the criteria, as returned by /extract-criteria")
+    parser.add_argument("--state", default="rank_state.jsonl", help="State file used to resume an interrupted run")
+    parser.add_argument("--output", default="Resume scorer card.csv", help="Ranking table to write, the format (csv, parquet or json) follows the extension")
+    parser.add_argument("--batch-size", type=int, default=1, help="Number of resumes scored together in a single model call")
+    parser.add_argument("--scoring-mode", choices=scoring_modes, default=default_scoring_mode,
+                        help="reflective, or lean for a minimal system prompt with structured output (faster and cheaper)")
+    parser.add_argument("--top-k", type=int, help="Keep only the top_k best candidates in the ranking table")
+    parser.add_argument("--retry-failed", action="store_true", help="Score again the resumes that failed in a previous run")
+    parser.add_argument("resumes", nargs="+", help="Resume files, directories or glob patterns")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.state) and not (args.criteria or args.job_description):
+        parser.error("one of --job-description or --criteria is required for a new run")
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        shutdown_parser_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import time
+import asyncio
+from utils.cache import SQLiteCache, TieredCache
+
+def stored_size(cache: SQLiteCache) -> int:
+    return cache.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+def total_size(cache: SQLiteCache) -> int:
+    return cache.connection.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+# the running total follows inserts, replaced entries and expired entries
+def test_total_size_follows_the_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    cache.set("a", "x" * 100)
+    cache.set("b", "x" * 200)
+    cache.set("a", "x" * 50)
+    cache.set("c", "x" * 10, time.time() - 1)
+    assert total_size(cache) == stored_size(cache) == 260
+
+    assert cache.get("c") is None
+    assert total_size(cache) == stored_size(cache) == 250
+
+    # the total is kept by the other connections to the same file
+    other = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    other.set("d", "x" * 100)
+    assert total_size(cache) == stored_size(cache) == 350
+
+# a full cache drops the expired and least recently used entries, down to evict_ratio of max_bytes
+def test_full_cache_evicts_the_least_recently_used_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    cache.set("expired", "x" * 100, time.time() - 1)
+    for index in range(4):
+        cache.set(f"entry {index}", "x" * 200)
+    cache.connection.execute("UPDATE entries SET accessed = accessed - 3600 WHERE key = 'entry 0'")
+
+    cache.set("entry 4", "x" * 200)
+
+    assert {row[0] for row in cache.connection.execute("SELECT key FROM entries")} == {"entry 1", "entry 2", "entry 3", "entry 4"}
+    assert total_size(cache) == stored_size(cache) == 800
+
+# lookups only write the access time once it is older than access_resolution
+def test_lookups_dont_write_recent_access_times(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    cache.set("a", "value")
+    changes = cache.connection.total_changes
+    assert cache.get("a") == "value"
+    assert cache.connection.total_changes == changes
+
+    cache.connection.execute("UPDATE entries SET accessed = accessed - 3600")
+    changes = cache.connection.total_changes
+    assert cache.get("a") == "value"
+    assert cache.connection.total_changes == changes + 1
+
+# cache files written before the total was kept get it computed when they are opened
+def test_total_size_of_older_cache_files(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    cache.set("a", "x" * 100)
+    cache.connection.execute("DROP TABLE meta")
+
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), 1000)
+    assert total_size(cache) == 100
+
+def test_disk_tier_from_the_event_loop(tmp_path):
+    cache = TieredCache(1000, str(tmp_path / "cache.sqlite3"), 1000)
+
+    async def run():
+        await cache.set_async("a", "value")
+        cache.memory = type(cache.memory)(1000)
+        return await cache.get_async("a"), await cache.get_async("a"), await cache.get_async("b")
+
+    assert asyncio.run(run()) == ("value", "value", None)
+    assert (cache.disk_hits, cache.memory_hits, cache.misses) == (1, 1, 1)
@@ -0,0 +1,16 @@
+from utils.compaction import compact_resume, strip_page_furniture
+
+def test_repeated_page_header_is_kept_on_the_first_page():
+    text = ("John Doe | john@doe.com\nExperience\nSenior engineer at Acme building data pipelines\nPage 1 of 2"
+            "\fJohn Doe | john@doe.com\nSkills\nPython, AWS, Kubernetes and Terraform\nPage 2 of 2")
+
+    compacted, _, _ = compact_resume(text, 4000)
+
+    assert compacted.count("John Doe | john@doe.com") == 1
+    assert compacted.startswith("John Doe | john@doe.com")
+    assert "Python, AWS, Kubernetes and Terraform" in compacted
+    assert compacted.count("Page") == 1
+
+def test_single_page_is_left_alone():
+    text = "John Doe\nPage 1 of 1"
+    assert strip_page_furniture(text) == text
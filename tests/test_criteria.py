@@ -0,0 +1,23 @@
+import json
+import asyncio
+from utils import helpers
+
+# a response without a list of criteria is retried with an error correction prompt and never cached
+def test_criteria_of_the_wrong_shape_are_retried(monkeypatch):
+    responses = [json.dumps({"criteria": "5+ years of Python development"}), json.dumps({"criteria": ["5+ years of Python development"]})]
+    prompts = []
+    cached = []
+
+    async def generate_response_async(prompt, purpose="other", **options):
+        prompts.append(prompt)
+        return responses.pop(0)
+
+    async def cache_response(prompt, response, **options):
+        cached.append(response)
+
+    monkeypatch.setattr(helpers, "generate_response_async", generate_response_async)
+    monkeypatch.setattr(helpers, "cache_response", cache_response)
+
+    assert asyncio.run(helpers.generate_ranking_criteria("Python developer")) == {"criteria": ["5+ years of Python development"]}
+    assert len(prompts) == 2 and "\"criteria\" key" in prompts[1]
+    assert cached == [json.dumps({"criteria": ["5+ years of Python development"]})]
@@ -0,0 +1,28 @@
+import time
+import asyncio
+from utils import helpers
+
+# stand-in for the document parser, ".hang" documents never finish
+def parse_document(file_ext: str, source: bytes) -> str:
+    if file_ext == ".hang":
+        time.sleep(60)
+    return source.decode()
+
+# a document that hangs its worker can't take the extraction of the next documents down with it
+def test_hung_documents_dont_block_the_next_ones(monkeypatch):
+    monkeypatch.setattr(helpers, "parse_document", parse_document)
+    monkeypatch.setattr(helpers, "parser_workers", 2)
+    monkeypatch.setattr(helpers, "extraction_timeout", 0.5)
+    helpers.shutdown_parser_pool()
+
+    async def extract():
+        hung = await asyncio.gather(*[helpers.extract_content(".hang", f"hung {index} {time.time()}".encode()) for index in range(2)])
+        return hung, await helpers.extract_content(".txt", f"valid {time.time()}".encode())
+
+    try:
+        hung, valid = asyncio.run(extract())
+        assert hung == [None, None]
+        assert valid is not None and valid.startswith("valid")
+    finally:
+        helpers.shutdown_parser_pool()
+    assert helpers._retired_workers == []
@@ -0,0 +1,23 @@
+import asyncio
+from models import CriteriaHeaders
+from utils import helpers
+from utils.score_store import ScoreStore
+
+# criteria given the same header in separate runs get distinct headers once they are used together
+def test_stored_headers_that_clash_are_numbered(tmp_path, monkeypatch):
+    store = ScoreStore(str(tmp_path / "scores.sqlite3"))
+    monkeypatch.setattr(helpers, "score_store", store)
+
+    async def generate_criteria_headers(criteria_list):
+        return CriteriaHeaders(criteria_headers={criterion: "Cloud and Python Experience" for criterion in criteria_list})
+    monkeypatch.setattr(helpers, "generate_criteria_headers", generate_criteria_headers)
+
+    asyncio.run(helpers.get_criteria_headers(["Python experience"]))
+    asyncio.run(helpers.get_criteria_headers(["AWS experience"]))
+    headers = asyncio.run(helpers.get_criteria_headers(["Python experience", "AWS experience"])).criteria_headers
+
+    assert headers == {"Python experience": "Cloud and Python Experience", "AWS experience": "Cloud and Python Experience 2"}
+
+def test_unique_headers_keep_the_first_header():
+    assert helpers.get_unique_headers({"a": "Skills", "b": "Tools", "c": "Skills", "d": "Skills"}) == \
+        {"a": "Skills", "b": "Tools", "c": "Skills 2", "d": "Skills 3"}
@@ -0,0 +1,97 @@
+import time
+import asyncio
+import sqlite3
+import jobs
+from jobs import JobStore, JobWorker, RUNNING
+
+def create_job(store: JobStore, tmp_path) -> str:
+    path = tmp_path / "resume.pdf"
+    path.write_bytes(b"%PDF")
+    return store.create_job(["Python experience"], 1, "reflective", [("resume.pdf", ".pdf", str(path))])
+
+# a worker whose lease was taken over by another worker stops processing the job and keeps polling
+def test_lost_lease_stops_the_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "lease_seconds", 0.3)
+    monkeypatch.setattr(jobs, "poll_seconds", 0.05)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = create_job(store, tmp_path)
+    events = []
+
+    class Worker(JobWorker):
+        async def process_job(self, job_id):
+            events.append("started")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                events.append("stopped")
+                raise
+
+    async def run():
+        worker = Worker(store)
+        worker.start()
+        await asyncio.sleep(0.05)
+        store.connection.execute("UPDATE jobs SET lease_owner = 'other-worker', lease_expires = ? WHERE id = ?", (time.time() + 60, job_id))
+        await asyncio.sleep(0.3)
+        # the job was stopped by the heartbeat, not by stopping the worker
+        stopped = list(events)
+        running = not worker.task.done()
+        await worker.stop()
+        return stopped, running
+
+    stopped, running = asyncio.run(run())
+    assert stopped == ["started", "stopped"]
+    assert running
+    job = store.get_job(job_id)
+    assert job["status"] == RUNNING and job["lease_owner"] == "other-worker"
+
+# a locked database while claiming a job doesn't stop the worker
+def test_claim_errors_keep_the_worker_polling(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "poll_seconds", 0.01)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    claims = []
+
+    def claim_job(owner):
+        claims.append(owner)
+        if len(claims) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return None
+    monkeypatch.setattr(store, "claim_job", claim_job)
+
+    async def run():
+        worker = JobWorker(store)
+        worker.start()
+        await asyncio.sleep(0.1)
+        running = not worker.task.done()
+        await worker.stop()
+        return running
+
+    assert asyncio.run(run())
+    assert len(claims) > 1
+
+# uploads are copied into the store in chunks and dropped once the resume is scored
+def test_uploads_are_stored_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "upload_chunk_bytes", 4)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    path = tmp_path / "resume.pdf"
+    path.write_bytes(b"%PDF resume content")
+
+    job_id = store.create_job(["Python experience"], 1, "reflective", [("resume.pdf", ".pdf", str(path))])
+
+    assert store.connection.execute("SELECT COUNT(*) FROM resume_chunks WHERE job_id = ?", (job_id,)).fetchone()[0] == 5
+    assert store.get_pending_resumes(job_id, 10) == [(0, ".pdf", b"%PDF resume content")]
+    store.save_result(job_id, 0, None)
+    assert store.connection.execute("SELECT COUNT(*) FROM resume_chunks WHERE job_id = ?", (job_id,)).fetchone()[0] == 0
+
+# a job whose uploads couldn't be copied leaves nothing behind
+def test_failed_upload_leaves_no_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    path = tmp_path / "resume.pdf"
+    path.write_bytes(b"%PDF")
+
+    try:
+        store.create_job(["Python experience"], 1, "reflective", [("resume.pdf", ".pdf", str(path)), ("gone.pdf", ".pdf", str(tmp_path / "gone.pdf"))])
+    except FileNotFoundError:
+        pass
+
+    for table in ("jobs", "resumes", "resume_chunks"):
+        assert store.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
@@ -0,0 +1,106 @@
+import time
+import asyncio
+import sqlite3
+import httpx
+import pytest
+from email.utils import formatdate
+from openai import RateLimitError, InternalServerError
+from utils.scheduler import CallScheduler, CircuitOpenError, get_retry_after
+
+request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+def rate_limit_error(headers: dict) -> RateLimitError:
+    return RateLimitError("Rate limit reached", response=httpx.Response(429, headers=headers, request=request), body=None)
+
+def server_error() -> InternalServerError:
+    return InternalServerError("The server had an error", response=httpx.Response(500, request=request), body=None)
+
+# async call failing with the given errors first, then answering "ok"
+def failing_call(errors: list):
+    async def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return call
+
+def test_retry_after_headers():
+    assert get_retry_after(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert get_retry_after(rate_limit_error({"retry-after": "3"})) == 3
+    assert 0 < get_retry_after(rate_limit_error({"retry-after": formatdate(time.time() + 60, usegmt=True)})) <= 60
+    assert get_retry_after(rate_limit_error({})) is None
+
+def test_rate_limit_burst_is_backed_off_without_opening_the_circuit():
+    scheduler = CallScheduler(base_delay=0.01, failure_threshold=5)
+
+    async def burst():
+        # every call in flight gets a 429 once, the provider accepts the retries
+        calls = [failing_call([rate_limit_error({"retry-after-ms": "50"})]) for _ in range(8)]
+        return await asyncio.gather(*[scheduler.run_async(call) for call in calls])
+
+    start = time.perf_counter()
+    assert asyncio.run(burst()) == ["ok"] * 8
+    # the retries waited for the Retry-After delay
+    assert time.perf_counter() - start >= 0.05
+    assert scheduler.breaker.state == "closed"
+
+def test_circuit_opens_and_closes_after_a_successful_trial():
+    scheduler = CallScheduler(max_retries=10, base_delay=0.001, failure_threshold=3, reset_seconds=0.1)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run_async(failing_call([server_error() for _ in range(5)])))
+    assert scheduler.breaker.state == "open"
+
+    # calls fail fast while the circuit is open
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run_async(failing_call([])))
+
+    time.sleep(0.15)
+    assert scheduler.breaker.state == "half-open"
+    assert asyncio.run(scheduler.run_async(failing_call([]))) == "ok"
+    assert scheduler.breaker.state == "closed"
+
+def test_shared_buckets_dont_block_the_event_loop(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    scheduler = CallScheduler(requests_per_minute=60, state_path=path)
+
+    # another process holds the write lock of the buckets for a while
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def reserve_while_locked():
+        ticks = 0
+        call = asyncio.ensure_future(scheduler.run_async(failing_call([])))
+        asyncio.get_running_loop().call_later(0.3, other.execute, "COMMIT")
+        while not call.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks, call.result()
+
+    ticks, result = asyncio.run(reserve_while_locked())
+    assert result == "ok"
+    assert ticks >= 10
+
+def test_trial_call_cancelled_while_waiting_for_capacity_releases_the_trial():
+    scheduler = CallScheduler(requests_per_minute=1, max_retries=10, base_delay=0.001, failure_threshold=1, reset_seconds=0.1)
+
+    # the only request of the minute is used by the call that opens the circuit
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.run_async(failing_call([server_error(), server_error()])))
+    time.sleep(0.15)
+    assert scheduler.breaker.state == "half-open"
+
+    # the trial call waits for the next request of the minute and is cancelled meanwhile
+    async def cancel_while_waiting():
+        trial = asyncio.ensure_future(scheduler.run_async(failing_call([])))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_while_waiting())
+    assert not scheduler.breaker.trial_running
+
+    # the next trial call is let through once capacity is back
+    scheduler.requests.limit = None
+    assert asyncio.run(scheduler.run_async(failing_call([]))) == "ok"
+    assert scheduler.breaker.state == "closed"
@@ -0,0 +1,260 @@
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# function to build a content addressed key from the raw bytes of a document and its extension
+def content_key(content: bytes, file_ext: str) -> str:
+    return f"{hashlib.sha256(content).hexdigest()}{file_ext}"
+
+# same key as content_key for a document on disk, the file is hashed in chunks instead of being read at once
+def file_key(path: str, file_ext: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as document:
+        for chunk in iter(lambda: document.read(chunk_size), b""):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}{file_ext}"
+
+# in-memory cache which evicts the least recently used entries once the stored values go above max_bytes
+# entries can optionally expire, expires is a unix timestamp or None for entries that never expire
+class LRUCache:
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            value, value_size, expires = self.entries[key]
+            if expires is not None and expires <= time.time():
+                del self.entries[key]
+                self.size -= value_size
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires: Optional[float] = None):
+        value_size = len(value.encode())
+
+        # values bigger than the whole cache are never stored
+        if value_size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, value_size, expires)
+            self.size += value_size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def __len__(self):
+        return len(self.entries)
+
+# on-disk cache stored in a SQLite file, least recently used entries are evicted once the stored values go above max_bytes
+# the total size of the values is kept in the meta table, so an insert only looks at the other entries when the cache is full
+class SQLiteCache:
+
+    # a full cache is evicted down to this share of max_bytes, so it doesn't have to evict on every insert
+    evict_ratio = 0.9
+    # last access times are only updated when they are older than this (in seconds), so most lookups don't write
+    access_resolution = 60
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            accessed REAL NOT NULL,
+            expires REAL
+        )""")
+        # cache files created before entries could expire don't have the expires column
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(entries)")]
+        if "expires" not in columns:
+            self.connection.execute("ALTER TABLE entries ADD COLUMN expires REAL")
+
+        # eviction reads the sizes through these indexes, the values stored before them in the rows are never read
+        self.connection.execute("DROP INDEX IF EXISTS entries_accessed")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_size ON entries (accessed, size, expires)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_expires_size ON entries (expires, size)")
+
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        with self.transaction():
+            # cache files created before the total was kept get it computed once
+            if self.connection.execute("SELECT 1 FROM meta WHERE name = 'size'").fetchone() is None:
+                self.connection.execute("INSERT INTO meta (name, value) SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+
+    # write transaction shared with the other processes using the file, the total size is always updated along with the entries
+    @contextmanager
+    def transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    # adds delta to the total size of the values and returns the new total, has to run inside a transaction
+    def add_size(self, delta: int) -> int:
+        self.connection.execute("UPDATE meta SET value = value + ? WHERE name = 'size'", (delta,))
+        return self.connection.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    # returns the value along with its expiry time
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        with self.lock:
+            row = self.connection.execute("SELECT value, expires, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            value, expires, accessed = row
+            now = time.time()
+            if expires is not None and expires <= now:
+                with self.transaction():
+                    size = self.connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                    if size is not None:
+                        self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        self.add_size(-size[0])
+                return None
+
+            if now - accessed >= self.access_resolution:
+                self.connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return value, expires
+
+    def set(self, key: str, value: str, expires: Optional[float] = None):
+        value_size = len(value.encode())
+
+        if value_size > self.max_bytes:
+            return
+
+        with self.lock, self.transaction():
+            replaced = self.connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                (key, value, value_size, time.time(), expires)
+            )
+            total = self.add_size(value_size - (replaced[0] if replaced is not None else 0))
+            if total > self.max_bytes:
+                self.evict(total)
+
+    # removing expired entries and then the least recently used ones until the total size is back under
+    # evict_ratio of max_bytes, has to run inside a transaction
+    def evict(self, total: int):
+        target = self.max_bytes * self.evict_ratio
+        now = time.time()
+
+        stale_rows = []
+        freed = 0
+        for rowid, size in self.connection.execute("SELECT rowid, size FROM entries WHERE expires <= ?", (now,)):
+            stale_rows.append((rowid,))
+            freed += size
+
+        if total - freed > target:
+            for rowid, size, expires in self.connection.execute("SELECT rowid, size, expires FROM entries ORDER BY accessed"):
+                if total - freed <= target:
+                    break
+                if expires is not None and expires <= now:
+                    continue
+                stale_rows.append((rowid,))
+                freed += size
+
+        self.connection.executemany("DELETE FROM entries WHERE rowid = ?", stale_rows)
+        self.add_size(-freed)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+# two tier cache, looks up the in-memory LRU first and then the optional on-disk SQLite tier
+# if ttl (in seconds) is given, entries expire that long after they were stored
+class TieredCache:
+
+    def __init__(self, memory_max_bytes: int, disk_path: Optional[str] = None, disk_max_bytes: int = 0, ttl: Optional[float] = None):
+        self.memory = LRUCache(memory_max_bytes)
+        self.disk = SQLiteCache(disk_path, disk_max_bytes) if disk_path else None
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.get_memory(key)
+        return value if value is not None else self.get_disk(key)
+
+    def set(self, key: str, value: str):
+        expires = self.expiry()
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            self.disk.set(key, value, expires)
+
+    # versions of get and set for the event loop, the disk tier runs in a thread as it can wait for the
+    # other processes using the file
+    async def get_async(self, key: str) -> Optional[str]:
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        if self.disk is None:
+            return self.get_disk(key)
+        return await asyncio.to_thread(self.get_disk, key)
+
+    async def set_async(self, key: str, value: str):
+        expires = self.expiry()
+        self.memory.set(key, value, expires)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires)
+
+    def get_memory(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+        return value
+
+    # looks the key up in the disk tier, once it wasn't found in memory
+    def get_disk(self, key: str) -> Optional[str]:
+        if self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not None:
+                self.disk_hits += 1
+                # promoting the entry so the next lookup doesn't touch the disk
+                self.memory.set(key, *entry)
+                return entry[0]
+
+        self.misses += 1
+        return None
+
+    def expiry(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    # hit/miss counters and sizes for monitoring
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_entries": len(self.disk) if self.disk is not None else 0
+        }
@@ -0,0 +1,150 @@
+import re
+from collections import Counter
+from typing import List, Tuple
+
+# Compaction of the extracted resume text before it goes into the scoring prompt: normalizes whitespace,
+# strips page furniture (headers, footers and page numbers repeated on every page), drops duplicated lines
+# and enforces a token budget, truncating the least useful sections first so experience and skills are kept.
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # without tiktoken (or its encoding files) tokens are estimated from the length of the text
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+# section headings and how important they are for scoring, lower is kept first
+section_priorities = [
+    (0, ["experience", "work experience", "professional experience", "employment", "employment history", "work history", "career history",
+         "skills", "technical skills", "core skills", "key skills", "core competencies", "competencies", "technologies", "tech stack"]),
+    (1, ["projects", "key projects", "certifications", "certificates", "licenses", "education", "qualifications", "academic background",
+         "summary", "professional summary", "profile", "objective", "about me", "achievements", "accomplishments"]),
+    (2, ["publications", "awards", "honors", "volunteer", "volunteering", "languages", "interests", "hobbies", "activities",
+         "references", "personal details", "personal information", "declaration"])
+]
+headings = {heading: priority for priority, names in section_priorities for heading in names}
+
+# the contact details at the top of the resume (name, email, ...) are always kept
+preamble_priority = -1
+
+def normalize_whitespace(text: str) -> str:
+    text = text.replace("\u00a0", " ").replace("\u200b", "").replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+# key used to match page furniture across pages, digits of short lines are ignored so "Page 2 of 5" matches "Page 3 of 5"
+def furniture_key(line: str) -> str:
+    words = line.lower().split()
+    key = " ".join(words)
+    return re.sub(r"\d+", "#", key) if len(words) <= 4 else key
+
+# function to drop the lines repeated at the top or bottom of most pages, pages are separated by form feeds
+# the first occurrence of every repeated line is kept, as page headers often hold the name and contact details
+def strip_page_furniture(text: str, edge_lines: int = 3) -> str:
+
+    pages = [page.split("\n") for page in text.split("\f")]
+    if len(pages) < 2:
+        return text
+
+    # positions of the first and last non empty lines of every page
+    edges = []
+    for lines in pages:
+        filled = [position for position, line in enumerate(lines) if line.strip()]
+        edges.append(set(filled[:edge_lines] + filled[-edge_lines:]))
+
+    # counting on how many pages every top/bottom line appears
+    page_counts = Counter()
+    for lines, positions in zip(pages, edges):
+        page_counts.update({furniture_key(lines[position]) for position in positions})
+
+    furniture = {key for key, count in page_counts.items() if count >= max(2, len(pages) / 2)}
+
+    kept = set()
+    compacted = []
+    for lines, positions in zip(pages, edges):
+        page_lines = []
+        for position, line in enumerate(lines):
+            key = furniture_key(line)
+            if position in positions and key in furniture:
+                if key in kept:
+                    continue
+                kept.add(key)
+            page_lines.append(line)
+        compacted.append("\n".join(page_lines))
+
+    return "\n".join(compacted)
+
+# function to drop repeated lines, short lines (like a skill name) can legitimately repeat so they are kept
+def dedupe_lines(text: str, min_length: int = 25) -> str:
+
+    seen = set()
+    lines = []
+    for line in text.split("\n"):
+        key = line.lower()
+        if len(line) >= min_length:
+            if key in seen:
+                continue
+            seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+def get_heading_priority(line: str):
+    heading = re.sub(r"[^a-z &]", "", line.lower()).strip()
+    if len(line) > 40 or not heading:
+        return None
+    return headings.get(heading)
+
+# function to split the text into (priority, lines) sections on the known headings
+def split_sections(text: str) -> List[Tuple[int, List[str]]]:
+
+    sections = [(preamble_priority, [])]
+    for line in text.split("\n"):
+        priority = get_heading_priority(line)
+        if priority is not None:
+            sections.append((priority, [line]))
+        else:
+            sections[-1][1].append(line)
+    return sections
+
+# function to fit the text in the token budget, sections are kept by priority and the section where the budget
+# runs out is cut line by line, the kept sections stay in their original order
+def truncate_to_budget(text: str, token_budget: int) -> str:
+
+    if count_tokens(text) <= token_budget:
+        return text
+
+    sections = split_sections(text)
+    order = sorted(range(len(sections)), key=lambda index: sections[index][0])
+
+    kept = [[] for _ in sections]
+    remaining = token_budget
+    for index in order:
+        for line in sections[index][1]:
+            # the newline joining the lines counts too
+            line_tokens = count_tokens(line) + 1
+            if line_tokens > remaining:
+                remaining = 0
+                break
+            kept[index].append(line)
+            remaining -= line_tokens
+        if remaining <= 0:
+            break
+
+    return "\n".join(line for lines in kept for line in lines).strip()
+
+# function to compact a resume, returns the compacted text with the token counts before and after
+def compact_resume(text: str, token_budget: int) -> Tuple[str, int, int]:
+
+    tokens_before = count_tokens(text)
+
+    compacted = strip_page_furniture(text.replace("\r\n", "\n"))
+    compacted = normalize_whitespace(compacted.replace("\f", "\n"))
+    compacted = dedupe_lines(compacted)
+    compacted = truncate_to_budget(compacted, token_budget)
+
+    return compacted, tokens_before, count_tokens(compacted)
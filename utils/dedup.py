@@ -0,0 +1,86 @@
+import re
+import hashlib
+import numpy as np
+from typing import List, Set, Tuple
+
+# Near-duplicate detection of resumes with MinHash and locality sensitive hashing (LSH).
+# Every text is cut in overlapping word shingles, the MinHash signature of the shingles estimates the Jaccard
+# similarity between two texts, and the signature is split in bands so only texts sharing a band are compared.
+
+num_perm = 128
+shingle_size = 5
+
+# hash functions of the signature are (a * x + b) mod prime, with shingle hashes below the prime
+_prime = (1 << 31) - 1
+_generator = np.random.default_rng(1)
+_a = _generator.integers(1, _prime, num_perm, dtype=np.uint64)
+_b = _generator.integers(0, _prime, num_perm, dtype=np.uint64)
+
+def shingles(text: str) -> Set[int]:
+    words = re.findall(r"\w+", text.lower())
+    # texts shorter than a shingle are a single shingle
+    phrases = [" ".join(words[start:start + shingle_size]) for start in range(max(len(words) - shingle_size + 1, 1))] if words else []
+    return {int.from_bytes(hashlib.blake2b(phrase.encode(), digest_size=8).digest(), "big") % _prime for phrase in phrases}
+
+def signature(text_shingles: Set[int]) -> np.ndarray:
+    if not text_shingles:
+        return np.full(num_perm, _prime, dtype=np.uint64)
+    values = np.fromiter(text_shingles, dtype=np.uint64, count=len(text_shingles))
+    return ((np.outer(_a, values) + _b[:, None]) % _prime).min(axis=1)
+
+# estimated Jaccard similarity of two texts from their signatures
+def estimate_similarity(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    return float(np.mean(signature_a == signature_b))
+
+def jaccard(shingles_a: Set[int], shingles_b: Set[int]) -> float:
+    if not shingles_a and not shingles_b:
+        return 1.0
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+# number of bands (and rows per band) whose LSH threshold (1 / bands) ^ (1 / rows) is the closest to the threshold,
+# pairs above the threshold almost always share a band
+def get_band_count(threshold: float) -> int:
+    divisors = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    return min(divisors, key=lambda bands: abs((1 / bands) ** (bands / num_perm) - threshold))
+
+# returns a key for every band of the signature, texts sharing a key are candidate duplicates
+def band_keys(text_signature: np.ndarray, threshold: float) -> List[str]:
+    bands = get_band_count(threshold)
+    rows = num_perm // bands
+    return [f"{bands}-{band}:{hashlib.blake2b(text_signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+            for band in range(bands)]
+
+# function to group near-duplicate texts, returns for every text the index of the first text of its group
+# texts are duplicates when the Jaccard similarity of their shingles is at least the threshold
+def find_duplicate_groups(texts: List[str], threshold: float) -> List[int]:
+
+    text_shingles = [shingles(text) for text in texts]
+    signatures = [signature(shingle_set) for shingle_set in text_shingles]
+
+    buckets = {}
+    for index, text_signature in enumerate(signatures):
+        for key in band_keys(text_signature, threshold):
+            buckets.setdefault(key, []).append(index)
+
+    # union find over the candidate pairs that are similar enough, the smallest index is the root of a group
+    parents = list(range(len(texts)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    checked: Set[Tuple[int, int]] = set()
+    for indices in buckets.values():
+        for position, first in enumerate(indices):
+            for second in indices[position + 1:]:
+                if (first, second) in checked:
+                    continue
+                checked.add((first, second))
+
+                if jaccard(text_shingles[first], text_shingles[second]) >= threshold:
+                    root_first, root_second = find(first), find(second)
+                    parents[max(root_first, root_second)] = min(root_first, root_second)
+
+    return [find(index) for index in range(len(texts))]
@@ -1,47 +1,300 @@
-import fitz
+import os
 import json
-from typing import List
-from docx import Document
+import time
+import heapq
+import numpy as np
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Hashable, List, Optional, Tuple, Union
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
-from llm import get_criteria_header_prompt, generate_response, get_scoring_prompt
-from models import CriteriaHeaders, CandidateScores
+from llm import get_ranking_criteria_prompt, get_criteria_header_prompt, generate_response_async, get_scoring_prompt, get_batch_scoring_prompt, cache_response, \
+    get_scores_schema, get_batch_scores_schema, default_scoring_mode, lean_max_tokens, default_model
+from models import CriteriaHeaders, CandidateScores, CascadeTier
+from openai import APIError
+from utils.cache import TieredCache, content_key, file_key
+from utils.scheduler import LLMUnavailableError
+from utils.score_store import ScoreStore, resume_key
+from utils.compaction import compact_resume, count_tokens
+from utils.metrics import record_retry, count_llm_calls, cascade_resumes
+from utils.dedup import shingles, signature, band_keys, estimate_similarity
 
-# Function to extract real content from bytes format content
-async def extract_content(file_ext: str, content: bytes) -> str:
+# pandas and the document parsers are slow to import, they are imported where they are used
+# (the parsers in the worker processes only), which keeps the startup of the app and of every worker fast
+if TYPE_CHECKING:
+    import pandas as pd
+
+# number of worker processes used to parse documents and the time limit (in seconds) for parsing a single document
+parser_workers = int(os.getenv("PARSER_WORKERS", os.cpu_count() or 1))
+# the workers are started with the app, instead of on the first upload
+parser_warmup = os.getenv("PARSER_WARMUP", "true").lower() == "true"
+extraction_timeout = float(os.getenv("EXTRACTION_TIMEOUT", "30"))
+
+# cache of extracted text keyed by the hash of the uploaded bytes, the on-disk tier is shared by every process of the app
+# (e.g. uvicorn workers), setting EXTRACTION_CACHE_DB to an empty value keeps the cache in memory only
+extraction_cache = TieredCache(
+    memory_max_bytes=int(os.getenv("EXTRACTION_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+    disk_path=os.getenv("EXTRACTION_CACHE_DB", "extraction_cache.sqlite3"),
+    disk_max_bytes=int(os.getenv("EXTRACTION_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+)
+
+# store of criteria headers and per criterion scores, so re-runs with changed criteria only score the new ones
+score_store = ScoreStore(os.getenv("SCORE_STORE_DB", "scores.sqlite3")) if os.getenv("INCREMENTAL_SCORING", "true").lower() == "true" else None
+
+# near-duplicate resumes (the same resume uploaded twice, or with small edits) are scored once,
+# resumes whose word shingles have a Jaccard similarity of at least the threshold are duplicates
+dedup_enabled = os.getenv("RESUME_DEDUP", "true").lower() == "true"
+dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+
+# cascade scoring: every resume is scored by the first tier model, then the resumes the first tier failed on and the
+# ones whose total score is within the band (in total score points) of the top K cutoff are scored by the second tier model
+cascade_first_model = os.getenv("CASCADE_FIRST_MODEL", "gpt-4o-mini")
+cascade_second_model = os.getenv("CASCADE_SECOND_MODEL", default_model)
+cascade_band = float(os.getenv("CASCADE_BAND", "2"))
+cascade_top_k = int(os.getenv("CASCADE_TOP_K", "10"))
+
+# extracted resumes are compacted to fit in this many tokens before scoring
+compaction_enabled = os.getenv("RESUME_COMPACTION", "true").lower() == "true"
+resume_token_budget = int(os.getenv("RESUME_TOKEN_BUDGET", "4000"))
+
+# process pool is created on first use
+_parser_pool = None
+
+# workers of the pools replaced after a document timed out, they are terminated once they are no longer needed
+_retired_workers = []
+_retired_pools = []
+
+def get_parser_pool() -> ProcessPoolExecutor:
+
+    global _parser_pool
+    if _parser_pool is None:
+        _parser_pool = ProcessPoolExecutor(max_workers=parser_workers)
+    return _parser_pool
+
+# imports the parsers in a worker process, returns the id of the process
+def warm_up_parser() -> int:
+    import fitz
+    import docx
+    return os.getpid()
+
+# function to start every worker of the parser pool ahead of the first upload, so no request pays for
+# starting the processes and importing the parsers, returns the number of workers started
+async def warm_up_parser_pool() -> int:
+
+    if not parser_warmup:
+        return 0
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    pool = get_parser_pool()
+    try:
+        # the pool only starts a new worker when no worker is idle, the tasks are sent at once so every worker is started
+        pids = await asyncio.gather(*[loop.run_in_executor(pool, warm_up_parser) for _ in range(parser_workers)])
+    except Exception as e:
+        # the workers are started again on the first upload
+        print(f"Parser workers warm up failed : {str(e)}")
+        shutdown_parser_pool()
+        return 0
+
+    print(f"{len(set(pids))} parser workers started in {time.perf_counter() - start:.2f} seconds")
+    return len(set(pids))
+
+def shutdown_parser_pool():
+
+    global _parser_pool
+    if _parser_pool is not None:
+        # a worker still parsing would keep the process from exiting, so the workers are terminated
+        processes = get_pool_workers(_parser_pool)
+        _parser_pool.shutdown(wait=False, cancel_futures=True)
+        _parser_pool = None
+        terminate_workers(processes)
+
+    for processes in list(_retired_workers):
+        terminate_workers(processes)
+
+# the pool has no public way to stop a busy worker, so its processes are read and terminated directly
+# (the pool forgets them once it is shut down)
+def get_pool_workers(pool: ProcessPoolExecutor) -> list:
+    return list((pool._processes or {}).values())
+
+def terminate_workers(processes: list):
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+    _retired_workers[:] = [workers for workers in _retired_workers if workers is not processes]
+
+# function to replace the pool whose worker is stuck on a document that timed out, as the worker can't be stopped
+# on its own. The next documents go to a new pool, and the documents already sent to the old pool get until the
+# extraction timeout to finish before its workers (the stuck one included) are terminated.
+def retire_parser_pool(pool: ProcessPoolExecutor):
+
+    global _parser_pool
+    if _parser_pool is pool:
+        _parser_pool = None
+
+    # the pool was already retired by another document
+    processes = get_pool_workers(pool)
+    if pool._processes is None:
+        return
+
+    _retired_workers.append(processes)
+    pool.shutdown(wait=False)
+
+    timer = threading.Timer(extraction_timeout, terminate_workers, [processes])
+    timer.daemon = True
+    timer.start()
+
+# Function to extract real content from a document, this runs inside a worker process
+# source is either the path of the document (opened lazily by the parsers) or its content as bytes
+def parse_document(file_ext: str, source: Union[str, bytes]) -> str:
     
     if file_ext==".pdf":
-        # Create a BytesIO object from the content
-        pdf_stream = BytesIO(content)
-        # Open the PDF using PyMuPDF
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        text = ""
-        # Iterate through pages and extract text
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
+        import fitz
+        # Open the PDF using PyMuPDF and join the text of every page, pages are separated by form feeds
+        with (fitz.open(source, filetype="pdf") if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")) as doc:
+            return "\f".join(page.get_text() for page in doc)
     
     elif file_ext==".docx":
-        docx_file = BytesIO(content)
-        doc = Document(docx_file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text.strip()
+        from docx import Document
+        doc = Document(source if isinstance(source, str) else BytesIO(source))
+        return "\n".join(paragraph.text for paragraph in doc.paragraphs).strip()
+
+# Function to extract content off the event loop, returns None if the document couldn't be parsed in time
+async def extract_content(file_ext: str, content: bytes) -> Optional[str]:
+    return await run_extraction(file_ext, content, content_key(content, file_ext))
+
+# Function to extract content of a document on disk, only the path is sent to the worker process
+# key is the extraction cache key of the document if it is already known (e.g. hashed while it was uploaded)
+async def extract_content_from_path(file_ext: str, path: str, key: Optional[str] = None) -> Optional[str]:
+    return await run_extraction(file_ext, path, key or file_key(path, file_ext))
+
+async def run_extraction(file_ext: str, source: Union[str, bytes], key: str) -> Optional[str]:
+
+    # repeat uploads of the same document skip parsing entirely
+    text = await extraction_cache.get_async(key)
+    if text is not None:
+        return text
+
+    loop = asyncio.get_running_loop()
+    pool = get_parser_pool()
+
+    try:
+        text = await asyncio.wait_for(
+            loop.run_in_executor(pool, parse_document, file_ext, source),
+            timeout=extraction_timeout
+        )
+        await extraction_cache.set_async(key, text)
+        return text
+
+    except asyncio.TimeoutError:
+        print(f"Document parsing took more than {extraction_timeout} seconds, skipping it!!")
+        # the worker keeps parsing the document, so it is replaced before every worker ends up stuck
+        retire_parser_pool(pool)
+        return None
+
+    except BrokenProcessPool:
+        # a worker died while parsing (e.g. a malformed file crashed the parser), start a fresh pool for the next documents
+        print("Parser worker crashed while parsing the document, skipping it!!")
+        retire_parser_pool(pool)
+        return None
+
+    except Exception as e:
+        print(f"Error in parsing document : {str(e)}")
+        return None
     
-# Function that handles the process of retrieving criteria headers from the extracted criteria
-async def get_criteria_headers(criteria_list: List) -> CriteriaHeaders:
+# Function to compact the extracted resume text before it is sent for scoring, returns the text with the token counts before and after
+def compact_resume_text(text: str) -> Tuple[str, int, int]:
+
+    if not compaction_enabled:
+        tokens = count_tokens(text)
+        return text, tokens, tokens
+
+    compacted, tokens_before, tokens_after = compact_resume(text, resume_token_budget)
+    print(f"Resume compacted from {tokens_before} to {tokens_after} tokens")
+    return compacted, tokens_before, tokens_after
+
+# Function that extracts the key ranking criteria from the text of a job description with the model
+async def generate_ranking_criteria(text_content: str) -> dict:
+
+    attempt = 1
+    max_retries = 3
+    error = False
+    error_correction_prompt = ""
+
+    # attempting retry in case of OPENAI error or json error
+    retry_cause = None
+    while attempt <= max_retries:
+
+        if retry_cause is not None:
+            record_retry(retry_cause)
+    
+        try:
+            prompt = get_ranking_criteria_prompt(text_content, error_correction_prompt)
+            criteria_response = await generate_response_async(prompt, "criteria")
+            ranking_criteria = json.loads(criteria_response)
+            print(ranking_criteria)
+
+            criteria = ranking_criteria.get("criteria") if isinstance(ranking_criteria, dict) else None
+            if not isinstance(criteria, list) or not all(isinstance(criterion, str) for criterion in criteria):
+                print("The criteria are missing from the response or are not a list of strings!!")
+                error = True
+                error_correction_prompt = "In the previous iteration, the response didn't have the criteria as a list of strings under the \"criteria\" key. Make sure the JSON response has a \"criteria\" key holding the list of criteria, each criterion being a string."
+                retry_cause = "missing_keys"
+                attempt += 1
+                continue
+
+            # the response is valid, so it is safe to serve it from the cache next time
+            await cache_response(prompt, criteria_response)
+            error = False
+            break
+
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON response: {str(e)}")
+            error_correction_prompt = "In the previous iteration, you failed to return a valid JSON response, please make sure the response is in the JSON format as mentioned."
+            retry_cause = "json_error"
+            attempt += 1
+            error = True
+            continue
+
+        except (LLMUnavailableError, APIError) as e:
+            # provider errors were already retried by the scheduler, asking again would only add load
+            print(f"Model call failed : {str(e)}")
+            error = True
+            break
+
+        except Exception as e:
+            print(f"Error in generating response : {str(e)}")
+            retry_cause = "other"
+            attempt += 1
+            error = True
+            continue
+
+    if error:
+        ranking_criteria = {"Error": "Failed to generate a response, please try again!!"}
+
+    return ranking_criteria
+
+# Function that handles the process of generating criteria headers from the extracted criteria with the model
+async def generate_criteria_headers(criteria_list: List) -> CriteriaHeaders:
 
     error_correction_prompt = ""
     attempt = 1
     max_retires = 2
     error = False
 
+    retry_cause = None
     while attempt <= max_retires:
 
+        if retry_cause is not None:
+            record_retry(retry_cause)
+
         try:
             prompt = get_criteria_header_prompt(criteria_list, error_correction_prompt)
-            response = generate_response(prompt)
+            response = await generate_response_async(prompt, "headers")
             # original_criteria_headers = json.loads(response)
             criteria_headers = json.loads(response)["criteria_headers"]
             print("Criteria headers: ",criteria_headers,"\n")
@@ -50,6 +303,7 @@ async def get_criteria_headers(criteria_list: List) -> CriteriaHeaders:
                 print("One or more criteria are missing from the response!!")
                 error = True
                 error_correction_prompt = "In the previous iteration, you missed out on some of the criteria from the output. Make sure that doesn't happen. All provided criteria should have a header."
+                retry_cause = "missing_keys"
                 attempt += 1
                 continue
 
@@ -58,24 +312,35 @@ async def get_criteria_headers(criteria_list: List) -> CriteriaHeaders:
                     print("Original criteria doesn't match the returned criteria!!")
                     error = True
                     error_correction_prompt = "In the previous iteration, you gave out the headers for every criteria but some of the criteria didn't matched the original criteria. Make sure the criteria in the returned output are same as you got in the input."
+                    retry_cause = "missing_keys"
                     attempt += 1
                     continue
                 
                 else:
                     pass
 
+            # the response is valid, so it is safe to serve it from the cache next time
+            await cache_response(prompt, response)
             error = False
             break
 
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON response: {str(e)}")
             error_correction_prompt = "In the previous iteration, you failed to return a valid JSON response, please make sure the response is in the JSON format as mentioned."
+            retry_cause = "json_error"
             attempt += 1
             error = True
             continue
 
+        except (LLMUnavailableError, APIError) as e:
+            # provider errors were already retried by the scheduler, asking again would only add load
+            print(f"Model call failed : {str(e)}")
+            error = True
+            break
+
         except Exception as e:
             print(f"Error in generating response : {str(e)}")
+            retry_cause = "other"
             attempt += 1
             error = True
             continue
@@ -85,65 +350,536 @@ async def get_criteria_headers(criteria_list: List) -> CriteriaHeaders:
 
     return CriteriaHeaders(criteria_headers=criteria_headers)
 
+# function to make the headers of the criteria unique, as the scores are keyed by header
+# criteria given their headers in different runs can have the same header, the later criteria get a numbered header
+def get_unique_headers(criteria_headers: dict) -> dict:
+
+    unique_headers = {}
+    used = set()
+    for criterion, header in criteria_headers.items():
+        unique_header = header
+        number = 2
+        while unique_header in used:
+            unique_header = f"{header} {number}"
+            number += 1
+        unique_headers[criterion] = unique_header
+        used.add(unique_header)
+
+    return unique_headers
+
+# Function to get the criteria headers, reusing the stored headers of criteria seen before
+# every criterion gets a distinct header, including criteria whose headers were stored in different runs
+async def get_criteria_headers(criteria_list: List) -> CriteriaHeaders:
+
+    if score_store is None or not criteria_list:
+        headers_response = await generate_criteria_headers(criteria_list)
+        return CriteriaHeaders(criteria_headers=get_unique_headers(headers_response.criteria_headers))
+
+    known_headers = score_store.get_headers(criteria_list)
+    missing = [criterion for criterion in criteria_list if criterion not in known_headers]
+
+    if missing:
+        new_headers = await generate_criteria_headers(missing)
+        if "Error" in new_headers.criteria_headers:
+            return new_headers
+
+        # two criteria can't share a header as the scores are keyed by header, if a new header clashes with
+        # another one all the headers are generated again together
+        headers = list(known_headers.values()) + list(new_headers.criteria_headers.values())
+        if len(set(headers)) < len(headers):
+            print("Generated headers clash with the stored headers, generating all of them again!!")
+            new_headers = await generate_criteria_headers(criteria_list)
+            if "Error" in new_headers.criteria_headers:
+                return new_headers
+
+        score_store.save_headers(new_headers.criteria_headers)
+        known_headers.update(new_headers.criteria_headers)
+
+    return CriteriaHeaders(criteria_headers=get_unique_headers({criterion: known_headers[criterion] for criterion in criteria_list}))
+
+# function to check the scores returned for a candidate, returns the error correction prompt if the scores are invalid
+def validate_candidate_scores(candidate_scores: dict, criteria_headers: dict) -> Optional[str]:
+
+    # checking if the number of items returned are same as input
+    if len(candidate_scores)-1!=len(criteria_headers.values()): # excluding name count from check
+        print("One or more criteria are missing from the response!!")
+        return "In the previous iteration, you missed out on some of the criteria from the output. Make sure that doesn't happen. A candidate needs to be evaluated on all the criteria, no matter what. Please make sure you follow the rules."
+
+    if sorted([key for key in candidate_scores.keys() if key != "Candidate Name"]) != sorted(list(criteria_headers.values())):
+        print("Criteria headers doesn't match the original headers provided!!")
+        return "In the previous iteration, you returned the scores for each criteria header but some of the criteria headers didn't matched the original criteria headers. Make sure the criteria headers in the returned output are same as you got in the input."
+
+    return None
+
+# function to get the request options of a scoring call in the given scoring mode, resume_ids are given for batch calls
+# lean calls follow the JSON schema of the expected response and get a completion budget per resume
+# the call goes to the default model unless a model is given
+def get_scoring_options(criteria_headers: dict, scoring_mode: str, resume_ids: Optional[List[str]] = None, model: Optional[str] = None) -> dict:
+
+    options = {"model": model} if model is not None else {}
+    if scoring_mode != "lean":
+        return options
+
+    if resume_ids is None:
+        return {**options, "response_schema": get_scores_schema(criteria_headers), "max_tokens": lean_max_tokens}
+    return {**options, "response_schema": get_batch_scores_schema(resume_ids, criteria_headers), "max_tokens": lean_max_tokens * len(resume_ids)}
+
 # function to get scores for each candidate resumes based on the resume content and criteria
-async def get_candidate_scores(content: str, criteria_headers: dict) -> CandidateScores:
+async def get_candidate_scores(content: str, criteria_headers: dict, scoring_mode: str = default_scoring_mode,
+                               model: Optional[str] = None) -> CandidateScores:
 
     error_correction_prompt = ""
     attempt = 1
     max_retires = 2
     error = False
+    options = get_scoring_options(criteria_headers, scoring_mode, model=model)
 
+    retry_cause = None
     while attempt <= max_retires:
 
+        if retry_cause is not None:
+            record_retry(retry_cause)
+
         try:
             prompt = get_scoring_prompt(content, criteria_headers, error_correction_prompt)
-            response = generate_response(prompt)
+            response = await generate_response_async(prompt, "scoring", **options)
             candidate_scores = json.loads(response)
 
             print("Scores: ",candidate_scores,"\n")
 
-            # checking if the number of items returned are same as input
-            if len(candidate_scores)-1!=len(criteria_headers.values()): # excluding name count from check
-                print("One or more criteria are missing from the response!!")
+            validation_error = validate_candidate_scores(candidate_scores, criteria_headers)
+            if validation_error is not None:
                 error = True
-                error_correction_prompt = "In the previous iteration, you missed out on some of the criteria from the output. Make sure that doesn't happen. A candidate needs to be evaluated on all the criteria, no matter what. Please make sure you follow the rules."
+                error_correction_prompt = validation_error
+                retry_cause = "missing_keys"
                 attempt += 1
                 continue
 
-            else:
-                if sorted([key for key in candidate_scores.keys() if key != "Candidate Name"]) != sorted(list(criteria_headers.values())):
-                    print("Criteria headers doesn't match the original headers provided!!")
-                    error = True
-                    error_correction_prompt = "In the previous iteration, you returned the scores for each criteria header but some of the criteria headers didn't matched the original criteria headers. Make sure the criteria headers in the returned output are same as you got in the input."
-                    attempt += 1
-                    continue
-                
-                else:
-                    pass
-
+            # the response is valid, so it is safe to serve it from the cache next time
+            await cache_response(prompt, response, **options)
             error = False
             break
 
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON response: {str(e)}")
             error_correction_prompt = "In the previous iteration, you failed to return a valid JSON response, please make sure the response is in the JSON format as mentioned."
+            retry_cause = "json_error"
             attempt += 1
             error = True
             continue
 
+        except (LLMUnavailableError, APIError) as e:
+            # provider errors were already retried by the scheduler, asking again would only add load
+            print(f"Model call failed : {str(e)}")
+            error = True
+            break
+
         except Exception as e:
             print(f"Error in generating response : {str(e)}")
+            retry_cause = "other"
             attempt += 1
             error = True
             continue
 
     if error:
-        return CandidateScores(
-            Candidate_Name="Error",
-            scores={"Error": "Failed to generate scores, please try again!!"}
-        )
+        # scores are left empty as they only hold integers, the name marks the failure
+        return CandidateScores(Candidate_Name="Error", scores={})
 
     return CandidateScores(
         Candidate_Name=candidate_scores.pop("Candidate Name"),
         scores=candidate_scores
-    )
\ No newline at end of file
+    )
+
+# function to score several resumes in a single request, the results are in the same order as the contents
+# candidates that fail validation are split into smaller batches and retried, down to one resume per request
+async def get_batch_candidate_scores(contents: List[str], criteria_headers: dict, scoring_mode: str = default_scoring_mode,
+                                     model: Optional[str] = None) -> List[CandidateScores]:
+
+    if len(contents) == 1:
+        return [await get_candidate_scores(contents[0], criteria_headers, scoring_mode, model)]
+
+    candidate_ids = [f"Resume {index + 1}" for index in range(len(contents))]
+    results = [None] * len(contents)
+    retry_cause = "missing_keys"
+    options = get_scoring_options(criteria_headers, scoring_mode, candidate_ids, model)
+
+    try:
+        prompt = get_batch_scoring_prompt(dict(zip(candidate_ids, contents)), criteria_headers)
+        response = await generate_response_async(prompt, "batch_scoring", **options)
+        batch_scores = json.loads(response)["candidates"]
+
+        print("Batch scores: ",batch_scores,"\n")
+
+        for index, candidate_id in enumerate(candidate_ids):
+            candidate_scores = batch_scores.get(candidate_id)
+
+            if not isinstance(candidate_scores, dict) or validate_candidate_scores(candidate_scores, criteria_headers) is not None:
+                print(f"Scores for {candidate_id} are invalid in the batch response!!")
+                continue
+
+            try:
+                results[index] = CandidateScores(
+                    Candidate_Name=candidate_scores.pop("Candidate Name"),
+                    scores=candidate_scores
+                )
+            except Exception as e:
+                print(f"Invalid scores for {candidate_id} : {str(e)}")
+
+        if all(result is not None for result in results):
+            await cache_response(prompt, response, **options)
+
+    except json.JSONDecodeError as e:
+        print(f"Error parsing JSON response: {str(e)}")
+        retry_cause = "json_error"
+
+    except (LLMUnavailableError, APIError) as e:
+        # provider errors were already retried by the scheduler, splitting the batch would only add load
+        print(f"Model call failed : {str(e)}")
+        return [CandidateScores(Candidate_Name="Error", scores={}) for _ in contents]
+
+    except Exception as e:
+        print(f"Error in generating batch response : {str(e)}")
+        retry_cause = "other"
+
+    failed = [index for index, result in enumerate(results) if result is None]
+    if not failed:
+        return results
+
+    # splitting the failed candidates in two halves and retrying them
+    middle = (len(failed) + 1) // 2
+    halves = [half for half in (failed[:middle], failed[middle:]) if half]
+    for _ in halves:
+        record_retry(retry_cause)
+    retried = await asyncio.gather(*[
+        get_batch_candidate_scores([contents[index] for index in half], criteria_headers, scoring_mode, model) for half in halves
+    ])
+
+    for half, half_results in zip(halves, retried):
+        for index, result in zip(half, half_results):
+            results[index] = result
+
+    return results
+
+# function to score a list of resume contents concurrently, the results are in the same order as the contents
+# with batch_size above 1, that many resumes are scored together in a single request
+async def generate_candidate_scores(contents: List[str], criteria_headers: dict, batch_size: int = 1,
+                                    scoring_mode: str = default_scoring_mode, model: Optional[str] = None) -> List[CandidateScores]:
+
+    # concurrency is bounded by the semaphore inside generate_response_async
+    if batch_size <= 1:
+        return await asyncio.gather(*[get_candidate_scores(content, criteria_headers, scoring_mode, model) for content in contents])
+
+    batches = [contents[start:start + batch_size] for start in range(0, len(contents), batch_size)]
+    batch_results = await asyncio.gather(*[get_batch_candidate_scores(batch, criteria_headers, scoring_mode, model) for batch in batches])
+
+    return [result for results in batch_results for result in results]
+
+# function to score a list of resume contents, the results are in the same order as the contents
+# scores stored from previous runs are reused, so a resume is only scored on the criteria it wasn't scored on before
+async def get_all_candidate_scores(contents: List[str], criteria_headers: dict, batch_size: int = 1,
+                                   scoring_mode: str = default_scoring_mode, model: Optional[str] = None) -> List[CandidateScores]:
+
+    if score_store is None:
+        return await generate_candidate_scores(contents, criteria_headers, batch_size, scoring_mode, model)
+
+    # scores of every mode and model are stored apart, so a lean score is never reused by a reflective run and vice versa
+    # (reflective scores of the default model are stored under the plain criterion)
+    stored_criteria = {get_stored_criterion(criterion, scoring_mode, model): criterion for criterion in criteria_headers}
+    stored_headers = {stored: criteria_headers[criterion] for stored, criterion in stored_criteria.items()}
+
+    criteria = list(stored_criteria.keys())
+    keys = [resume_key(content) for content in contents]
+    stored_scores = [score_store.get_scores(key, criteria) for key in keys]
+    names = [score_store.get_name(key) for key in keys]
+
+    # resumes never seen before start from the stored scores of a near-duplicate scored in an earlier request or job
+    signatures = {}
+    if dedup_enabled:
+        for index, key in enumerate(keys):
+            if names[index] is None:
+                text_signature, text_band_keys, duplicate_key = find_near_duplicate(contents[index])
+                signatures[index] = (text_signature, text_band_keys)
+
+                duplicate_name = score_store.get_name(duplicate_key) if duplicate_key is not None else None
+                if duplicate_name is not None:
+                    stored_scores[index] = score_store.get_scores(duplicate_key, criteria)
+                    names[index] = duplicate_name
+                    score_store.save_scores(key, duplicate_name, stored_scores[index])
+        reused = sum(names[index] is not None for index in signatures)
+        if reused:
+            print(f"{reused} resumes are near-duplicates of resumes in the score store, their stored scores are reused")
+
+    # grouping the resumes on the criteria they still have to be scored on, so each group is scored (and batched) together
+    groups = {}
+    for index, scores in enumerate(stored_scores):
+        missing = tuple(criterion for criterion in criteria if criterion not in scores)
+        if missing:
+            groups.setdefault(missing, []).append(index)
+
+    group_results = await asyncio.gather(*[
+        generate_candidate_scores(
+            [contents[index] for index in indices],
+            {stored_criteria[criterion]: stored_headers[criterion] for criterion in missing},
+            batch_size,
+            scoring_mode,
+            model
+        )
+        for missing, indices in groups.items()
+    ])
+
+    results = [None] * len(contents)
+    for (missing, indices), group_scores in zip(groups.items(), group_results):
+        header_criteria = {stored_headers[criterion]: criterion for criterion in missing}
+
+        for index, scores_response in zip(indices, group_scores):
+            if scores_response.Candidate_Name == "Error":
+                results[index] = scores_response
+                continue
+
+            new_scores = {header_criteria[header]: score for header, score in scores_response.scores.items()}
+            score_store.save_scores(keys[index], scores_response.Candidate_Name, new_scores)
+            stored_scores[index].update(new_scores)
+            names[index] = scores_response.Candidate_Name
+
+    # signatures of the new resumes are stored once they are scored, so later requests and jobs can find them
+    for index, (text_signature, text_band_keys) in signatures.items():
+        if names[index] is not None:
+            score_store.save_signature(keys[index], text_signature.tobytes(), text_band_keys)
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = CandidateScores(
+                Candidate_Name=names[index],
+                scores={stored_headers[criterion]: stored_scores[index][criterion] for criterion in criteria}
+            )
+
+    if groups:
+        print(f"Scored {sum(len(missing) * len(indices) for missing, indices in groups.items())} out of {len(contents) * len(criteria)} resume/criterion pairs, the rest were reused from the score store")
+
+    return results
+
+def get_stored_criterion(criterion: str, scoring_mode: str, model: Optional[str] = None) -> str:
+
+    tags = []
+    if scoring_mode != "reflective":
+        tags.append(scoring_mode)
+    if model is not None and model != default_model:
+        tags.append(model)
+
+    return f"[{' '.join(tags)}] {criterion}" if tags else criterion
+
+# function to look up the most similar stored resume of a resume, returns the MinHash signature and band keys
+# of the resume along with the key of the stored resume (None if no stored resume is similar enough)
+def find_near_duplicate(content: str) -> Tuple[np.ndarray, List[str], Optional[str]]:
+
+    text_signature = signature(shingles(content))
+    text_band_keys = band_keys(text_signature, dedup_threshold)
+
+    best_key, best_similarity = None, dedup_threshold
+    for candidate_key, candidate_signature in score_store.find_similar(text_band_keys):
+        similarity = estimate_similarity(text_signature, np.frombuffer(candidate_signature, dtype=np.uint64))
+        if similarity >= best_similarity:
+            best_key, best_similarity = candidate_key, similarity
+
+    return text_signature, text_band_keys, best_key
+
+# function to get the position of the first resume of every group of near-duplicates, only these resumes are scored
+def get_group_representatives(duplicate_groups: List[Hashable]) -> List[int]:
+
+    first_positions = {}
+    for position, group in enumerate(duplicate_groups):
+        first_positions.setdefault(group, position)
+
+    return list(first_positions.values())
+
+# function to give the scores of the first resume of every group (in the order of get_group_representatives) to the
+# whole group, the results are in the same order as the duplicate groups
+def share_group_scores(representative_scores: List[CandidateScores], duplicate_groups: List[Hashable]) -> List[CandidateScores]:
+
+    group_scores = dict(zip(dict.fromkeys(duplicate_groups), representative_scores))
+
+    if len(group_scores) < len(duplicate_groups):
+        print(f"{len(duplicate_groups) - len(group_scores)} near-duplicate resumes reused the scores of their group")
+
+    return [group_scores[group] for group in duplicate_groups]
+
+# function to score a list of resume contents with the cascade, in the same order as the contents
+# returns the scores along with the resumes and model calls of every tier
+async def get_cascade_scores(contents: List[str], criteria_headers: dict, batch_size: int = 1, scoring_mode: str = default_scoring_mode,
+                             top_k: Optional[int] = None, band: float = cascade_band) -> Tuple[List[CandidateScores], List[CascadeTier]]:
+
+    top_k = top_k or cascade_top_k
+
+    with count_llm_calls() as first_calls:
+        results = await get_all_candidate_scores(contents, criteria_headers, batch_size, scoring_mode, cascade_first_model)
+
+    # the cutoff is the total score of the top_k-th candidate, every candidate is in the top K when there are fewer
+    totals = [sum(result.scores.values()) if result.Candidate_Name != "Error" else None for result in results]
+    ranked_totals = sorted((total for total in totals if total is not None), reverse=True)
+    cutoff = ranked_totals[top_k - 1] if len(ranked_totals) >= top_k else None
+
+    escalated = [index for index, total in enumerate(totals)
+                 if total is None or (cutoff is not None and abs(total - cutoff) <= band)]
+
+    with count_llm_calls() as second_calls:
+        escalated_results = await get_all_candidate_scores([contents[index] for index in escalated], criteria_headers, batch_size,
+                                                           scoring_mode, cascade_second_model)
+
+    # a resume keeps its first tier scores if the second tier fails on it
+    for index, result in zip(escalated, escalated_results):
+        if result.Candidate_Name != "Error" or totals[index] is None:
+            results[index] = result
+
+    cascade_resumes.labels("1").inc(len(contents))
+    cascade_resumes.labels("2").inc(len(escalated))
+    print(f"Cascade scored {len(contents)} resumes with {cascade_first_model} and escalated {len(escalated)} to {cascade_second_model}"
+          + (f" (top {top_k} cutoff at {cutoff})" if cutoff is not None else ""))
+
+    return results, [
+        CascadeTier(tier=tier, model=model, resumes=resumes, llm_calls=calls["success"] + calls["error"], cached_calls=calls["cached"])
+        for tier, model, resumes, calls in [(1, cascade_first_model, len(contents), first_calls),
+                                            (2, cascade_second_model, len(escalated), second_calls)]
+    ]
+
+# function that yields (index, scores) for every resume content as soon as it is scored, in completion order
+async def iter_candidate_scores(contents: List[str], criteria_headers: dict, batch_size: int = 1, scoring_mode: str = default_scoring_mode):
+
+    batch_size = max(batch_size, 1)
+
+    async def score_batch(start):
+        return start, await get_all_candidate_scores(contents[start:start + batch_size], criteria_headers, batch_size, scoring_mode)
+
+    for finished in asyncio.as_completed([score_batch(start) for start in range(0, len(contents), batch_size)]):
+        start, results = await finished
+        for offset, result in enumerate(results):
+            yield start + offset, result
+
+# function to build the ranking table from candidate scores, sorted on the total score
+# if lexical scores are given (one per candidate), they are added as a column and candidates skipped by the
+# pre-filter (empty scores) are kept at the bottom of the table, ranked on their lexical score
+# if duplicate groups are given (the group of every candidate), candidates that have near-duplicates are flagged
+# with the number of their group, the column is empty for the rest
+# if top_k is given, only the top_k best candidates are kept
+def build_score_table(all_scores: List[CandidateScores], criteria_headers: dict, lexical_scores: Optional[List[float]] = None,
+                      top_k: Optional[int] = None, duplicate_groups: Optional[List[Hashable]] = None) -> "pd.DataFrame":
+    import pandas as pd
+
+    headers = list(criteria_headers.values())
+
+    # scores are accumulated column by column and the dataframe is built once at the end
+    names = []
+    columns = {header: [] for header in headers}
+    totals = []
+    lexical = []
+    duplicates = []
+
+    # groups with more than one candidate are numbered in order of appearance
+    group_numbers = {}
+    if duplicate_groups is not None:
+        group_sizes = Counter(duplicate_groups)
+        for group in duplicate_groups:
+            if group_sizes[group] > 1:
+                group_numbers.setdefault(group, len(group_numbers) + 1)
+
+    for index, scores_response in enumerate(all_scores):
+
+        if scores_response.Candidate_Name == "Error":
+            continue
+
+        names.append(scores_response.Candidate_Name)
+
+        # scores are looked up by header, in case the returned output is not in the right order of columns
+        row_scores = [scores_response.scores.get(header) for header in headers]
+        for header, score in zip(headers, row_scores):
+            columns[header].append(score)
+
+        # total score stays empty for candidates that weren't scored
+        scored = [score for score in row_scores if score is not None]
+        totals.append(sum(scored) if scored else None)
+
+        if lexical_scores is not None:
+            lexical.append(round(float(lexical_scores[index]), 4))
+
+        if duplicate_groups is not None:
+            duplicates.append(group_numbers.get(duplicate_groups[index]))
+
+    # ranking on total score and then on lexical score, candidates without a total go last
+    def rank_key(row):
+        return (totals[row] is not None, totals[row] or 0, lexical[row] if lexical_scores is not None else 0)
+
+    rows = range(len(names))
+    if top_k is not None:
+        # a heap avoids sorting every candidate when only the best ones are needed
+        order = heapq.nlargest(top_k, rows, key=rank_key)
+    else:
+        order = sorted(rows, key=rank_key, reverse=True)
+
+    table = {'Candidate Name': [names[row] for row in order]}
+    for header in headers:
+        table[header] = pd.array([columns[header][row] for row in order], dtype="Int64")
+    if lexical_scores is not None:
+        table['Lexical Score'] = [lexical[row] for row in order]
+    table['Total Score'] = pd.array([totals[row] for row in order], dtype="Int64")
+    if duplicate_groups is not None:
+        table['Duplicate Group'] = pd.array([duplicates[row] for row in order], dtype="Int64")
+
+    return pd.DataFrame(table)
+
+# function to merge the criteria of several jobs into a single list, criteria shared by jobs are listed once
+def merge_criteria(job_criteria: List[List[str]]) -> List[str]:
+    return list(dict.fromkeys(criterion for criteria in job_criteria for criterion in criteria))
+
+# function to build the candidate by job matrix, with the total score of every candidate for every job
+# job_headers maps the name of every job to the criteria headers of its criteria, candidates that failed to score are left out
+def build_score_matrix(all_scores: List[CandidateScores], filenames: List[str], job_headers: dict) -> "pd.DataFrame":
+    import pandas as pd
+
+    names = []
+    files = []
+    columns = {job: [] for job in job_headers}
+
+    for scores_response, filename in zip(all_scores, filenames):
+        if scores_response.Candidate_Name == "Error":
+            continue
+
+        names.append(scores_response.Candidate_Name)
+        files.append(filename)
+        for job, criteria_headers in job_headers.items():
+            scored = [scores_response.scores[header] for header in criteria_headers.values() if header in scores_response.scores]
+            columns[job].append(sum(scored) if scored else None)
+
+    table = {'Candidate Name': names, 'File': files}
+    for job, totals in columns.items():
+        table[job] = pd.array(totals, dtype="Int64")
+
+    return pd.DataFrame(table)
+
+# output formats of the ranking table and the extension of their files
+output_formats = {"json": ".json", "csv": ".csv", "parquet": ".parquet"}
+
+# every request writes its ranking table to its own directory, so concurrent requests don't overwrite each other
+output_dir = os.getenv("OUTPUT_DIR", "outputs")
+
+# name is the name of the file without its extension, matrix requests also save score_matrix and ranking_<n> files
+def get_output_path(request_id: str, output_format: str, name: str = "resume_scores") -> str:
+    return os.path.join(output_dir, request_id, f"{name}{output_formats[output_format]}")
+
+# function to save the ranking table of a request in the given format, returns the path of the file
+def save_score_table(score_df: "pd.DataFrame", request_id: str, output_format: str, name: str = "resume_scores") -> str:
+
+    path = get_output_path(request_id, output_format, name)
+    write_score_table(score_df, path, output_format)
+    return path
+
+# function to write the ranking table to the given path in the given format
+def write_score_table(score_df: "pd.DataFrame", path: str, output_format: str):
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    if output_format == "csv":
+        score_df.to_csv(path, index=False)
+    elif output_format == "parquet":
+        # written through pyarrow
+        score_df.to_parquet(path, index=False)
+    else:
+        score_df.to_json(path, orient="records", indent=2)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import uuid
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import Counter as PrometheusCounter, Histogram, Gauge, CollectorRegistry, generate_latest, multiprocess
+
+# Instrumentation of the pipeline. Timings of every stage, model calls, token usage and retries by cause are
+# exported as Prometheus metrics (served on /metrics), and are also collected per request in a RequestTrace.
+# With TRACE_LOGS=true, every request logs its trace as a JSON line and every model call logs its raw response.
+# When the app runs in several processes (uvicorn --workers), setting PROMETHEUS_MULTIPROC_DIR to an empty directory
+# makes every process write its metrics there, and /metrics reports the metrics of all the processes.
+
+trace_logs = os.getenv("TRACE_LOGS", "false").lower() == "true"
+
+# stages are upload, extraction, compaction, criteria_extraction, criteria_headers, prefilter, dedup, scoring and ranking
+stage_seconds = Histogram("resume_ranker_stage_seconds", "Time spent in each stage of the pipeline", ["stage"])
+request_seconds = Histogram("resume_ranker_request_seconds", "Time spent handling a request", ["endpoint"])
+llm_call_seconds = Histogram("resume_ranker_llm_call_seconds", "Time spent in a single model call, retries included", ["purpose"],
+                             buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf")))
+llm_calls = PrometheusCounter("resume_ranker_llm_calls", "Model calls by purpose and outcome", ["purpose", "outcome"])
+llm_tokens = PrometheusCounter("resume_ranker_llm_tokens", "Tokens used by the model calls", ["model", "purpose", "type"])
+# causes are json_error and missing_keys (invalid responses asked again), rate_limit and provider_error
+# (provider errors retried by the scheduler) and other
+retries = PrometheusCounter("resume_ranker_retries", "Retried model calls by cause", ["cause"])
+
+# resumes scored by each tier of the cascade scoring, tier 2 are the resumes escalated to the stronger model
+cascade_resumes = PrometheusCounter("resume_ranker_cascade_resumes", "Resumes scored by each tier of the cascade scoring", ["tier"])
+
+# phases are import (importing the app modules) and warmup (starting the model client and the parser workers),
+# the slowest process is reported when there are several
+startup_seconds = Gauge("resume_ranker_startup_seconds", "Time spent starting the app", ["phase"], multiprocess_mode="max")
+
+# trace of the request being handled, shared by the tasks it starts
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# counts of the model calls made inside a count_llm_calls block, shared by the tasks it starts
+_call_counts = contextvars.ContextVar("call_counts", default=None)
+
+class RequestTrace:
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.request_id = uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.tokens = Counter()
+        self.calls = Counter()
+        self.retries = Counter()
+
+    # makes this trace the current one while the block runs
+    @contextmanager
+    def activate(self):
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        request_seconds.labels(self.endpoint).observe(elapsed)
+
+        if trace_logs:
+            print(json.dumps({
+                "trace": self.request_id,
+                "endpoint": self.endpoint,
+                "seconds": round(elapsed, 4),
+                "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                "llm_calls": dict(self.calls),
+                "tokens": dict(self.tokens),
+                "retries": dict(self.retries)
+            }))
+
+def get_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+# times the block as a stage of the current request
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.labels(name).observe(elapsed)
+        trace = get_trace()
+        if trace is not None:
+            trace.stages[name] += elapsed
+
+# counts the model calls made while the block runs by outcome (success, error or cached)
+@contextmanager
+def count_llm_calls():
+    counts = Counter()
+    token = _call_counts.set(counts)
+    try:
+        yield counts
+    finally:
+        _call_counts.reset(token)
+
+def count_llm_call(outcome: str):
+    counts = _call_counts.get()
+    if counts is not None:
+        counts[outcome] += 1
+
+def record_retry(cause: str):
+    retries.labels(cause).inc()
+    trace = get_trace()
+    if trace is not None:
+        trace.retries[cause] += 1
+
+# model calls answered from the response cache are only counted
+def record_cache_hit(purpose: str):
+    llm_calls.labels(purpose, "cached").inc()
+    count_llm_call("cached")
+
+# records a finished model call, usage is the usage block of the OpenAI response (None for failed calls)
+def record_llm_call(purpose: str, model: str, seconds: float, outcome: str, usage=None):
+    llm_call_seconds.labels(purpose).observe(seconds)
+    llm_calls.labels(purpose, outcome).inc()
+    count_llm_call(outcome)
+
+    tokens = {}
+    if usage is not None:
+        # cached tokens are the part of the prompt tokens served from the provider's prompt cache
+        details = getattr(usage, "prompt_tokens_details", None)
+        tokens = {"prompt": usage.prompt_tokens or 0, "completion": usage.completion_tokens or 0,
+                  "cached": (getattr(details, "cached_tokens", None) or 0) if details is not None else 0}
+        for token_type, count in tokens.items():
+            llm_tokens.labels(model, purpose, token_type).inc(count)
+
+    trace = get_trace()
+    if trace is not None:
+        trace.calls[purpose] += 1
+        trace.tokens.update({f"{purpose}_{token_type}": count for token_type, count in tokens.items()})
+
+# returns the metrics in the Prometheus text format, merged over every process in multiprocess mode
+def get_metrics_output() -> bytes:
+
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+# should be called when a process exits, so its gauges are no longer reported in multiprocess mode
+def mark_process_dead():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+# ASGI middleware tracing every HTTP request, the trace is finished once the whole response (streams included) is sent
+class TraceMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace(scope["path"])
+        try:
+            with trace.activate():
+                await self.app(scope, receive, send)
+        finally:
+            # the route template is known once the request was routed, it keeps the endpoint label bounded (/jobs/{job_id})
+            route = scope.get("route")
+            trace.endpoint = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+            trace.finish()
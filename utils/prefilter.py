@@ -0,0 +1,92 @@
+import re
+import numpy as np
+from typing import TYPE_CHECKING, List, Optional
+
+# scipy is slow to import, it is only imported once a pre-filter runs
+if TYPE_CHECKING:
+    from scipy import sparse
+
+# Lexical pre-filter used to shortlist resumes before they are scored by the model.
+# Resumes are ranked with BM25 against every criterion, the per-criterion scores are scaled to 0-1 by the best
+# matching resume and averaged, so the lexical score of a resume is between 0 (no overlap) and 1.
+
+# keeps tokens like "c++", "c#" and "node.js" together
+token_pattern = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9+#]+)*")
+
+stop_words = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "experience", "for", "from", "have", "in", "is", "it", "must",
+    "of", "on", "or", "strong", "the", "to", "with", "years", "year", "knowledge", "skills", "ability", "good"
+}
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in token_pattern.findall(text.lower()) if token not in stop_words]
+
+# function to build the sparse term count matrix of a list of texts over the given vocabulary
+def count_matrix(texts: List[List[str]], vocabulary: dict) -> "sparse.csr_matrix":
+    from scipy import sparse
+
+    rows, columns = [], []
+    for row, tokens in enumerate(texts):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    # duplicate (row, column) pairs are summed up, which gives the term counts
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float64), (rows, columns)),
+        shape=(len(texts), len(vocabulary))
+    )
+
+# function to score every document against the criteria, returns one lexical score per document
+def lexical_scores(documents: List[str], criteria: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+
+    if not documents:
+        return np.zeros(0)
+
+    document_tokens = [tokenize(document) for document in documents]
+    vocabulary = {}
+    for tokens in document_tokens:
+        for token in tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+
+    term_counts = count_matrix(document_tokens, vocabulary)
+
+    # inverse document frequency of every term
+    document_count = term_counts.shape[0]
+    document_frequency = np.bincount(term_counts.indices, minlength=len(vocabulary))
+    idf = np.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    # BM25 term weights, computed on the non zero entries only
+    lengths = np.asarray(term_counts.sum(axis=1)).ravel()
+    length_norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+    row_of_entry = np.repeat(np.arange(document_count), np.diff(term_counts.indptr))
+    weights = term_counts.copy()
+    weights.data = idf[weights.indices] * weights.data * (k1 + 1) / (weights.data + length_norm[row_of_entry])
+
+    # one column of scores per criterion
+    query_terms = count_matrix([tokenize(criterion) for criterion in criteria], vocabulary)
+    query_terms.data[:] = 1
+    scores = (weights @ query_terms.T).toarray()
+
+    # scaling every criterion by its best match so each criterion weighs the same
+    best = scores.max(axis=0)
+    scores = np.divide(scores, best, out=np.zeros_like(scores), where=best > 0)
+
+    return scores.mean(axis=1) if scores.shape[1] else np.zeros(document_count)
+
+# function to select the documents sent to the model, returns their indices in the original order
+# documents must score at least min_score (if given) and only the top_n best scoring are kept (if given)
+def shortlist(scores: np.ndarray, top_n: Optional[int] = None, min_score: Optional[float] = None) -> List[int]:
+
+    selected = np.arange(len(scores))
+
+    if min_score is not None:
+        selected = selected[scores[selected] >= min_score]
+
+    if top_n is not None and len(selected) > top_n:
+        best = np.argpartition(-scores[selected], top_n - 1)[:top_n] if top_n > 0 else []
+        selected = selected[best]
+
+    return sorted(int(index) for index in selected)
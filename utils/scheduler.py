@@ -0,0 +1,282 @@
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+from openai import APIStatusError, APIConnectionError, APITimeoutError
+from utils.metrics import record_retry
+
+# Process wide scheduler for the model calls. It keeps the calls within the requests and tokens per minute
+# limits of the account (token buckets), retries transient provider errors with jittered exponential backoff
+# honoring Retry-After, and fails fast with a circuit breaker when the provider keeps failing.
+# The token buckets can be kept in a SQLite file, so the processes of the app (e.g. uvicorn workers) share the limits.
+
+# raised when a model call can't be made, either the retries ran out or the circuit breaker is open
+class LLMUnavailableError(Exception):
+    pass
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+# status codes worth retrying, anything else (bad request, authentication, ...) fails right away
+retryable_status_codes = {408, 409, 429, 500, 502, 503, 504}
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in retryable_status_codes or error.status_code >= 500)
+
+# function to read the delay (in seconds) asked by the provider through the Retry-After headers
+def get_retry_after(error: Exception) -> Optional[float]:
+
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+
+    # the header can also be an HTTP date
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+# token bucket refilled continuously at limit per minute, a limit of None means no limit
+class TokenBucket:
+
+    def __init__(self, limit: Optional[float]):
+        self.limit = limit
+        self.tokens = limit or 0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    # seconds to wait before amount tokens are available, 0 if they are available now
+    def wait_time(self, amount: float) -> float:
+        if self.limit is None:
+            return 0
+        self.refill()
+        # a call bigger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.limit)
+        return max(amount - self.tokens, 0) * 60 / self.limit
+
+    def take(self, amount: float):
+        if self.limit is not None:
+            self.tokens -= min(amount, self.limit)
+
+# token buckets of every process using the same SQLite file, a reservation takes from all its buckets at once
+# or from none of them, times are wall clock times as monotonic clocks can't be compared between processes
+class SharedTokenBuckets:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )""")
+
+    # reserves the amounts given as (bucket name, limit per minute, amount), buckets with a limit of None are skipped
+    # returns the seconds to wait before every amount is available, 0 if they were taken
+    def reserve(self, amounts: List[Tuple[str, Optional[float], float]]) -> float:
+
+        # a call bigger than the whole bucket only waits for a full bucket
+        amounts = [(name, limit, min(amount, limit)) for name, limit, amount in amounts if limit is not None]
+        if not amounts:
+            return 0
+
+        with self.lock:
+            # the write lock is taken right away, so no other process can reserve between the read and the update
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                levels = {}
+                for name, limit, amount in amounts:
+                    row = self.connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                    levels[name] = limit if row is None else min(limit, row[0] + max(now - row[1], 0) * limit / 60)
+
+                wait = max(max(amount - levels[name], 0) * 60 / limit for name, limit, amount in amounts)
+                if wait == 0:
+                    for name, limit, amount in amounts:
+                        levels[name] -= amount
+
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    [(name, tokens, now) for name, tokens in levels.items()]
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        return wait
+
+# circuit breaker, opens after failure_threshold consecutive failures and lets a single trial call through
+# once reset_seconds have passed, the circuit closes again if the trial call succeeds
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    # returns True if the call is the trial call, which has to be released if it ends up not being made
+    def before_call(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return False
+
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_running:
+                raise CircuitOpenError("The model provider is failing, calls are paused for now")
+
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    # lets the next trial call through without counting the current one as a success or a failure
+    def release_trial(self):
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+# if state_path is given, the token buckets are kept in that SQLite file and shared with the other processes using it
+# (the circuit breaker stays per process, every process finds out on its own that the provider is failing)
+class CallScheduler:
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 5, base_delay: float = 1, max_delay: float = 60,
+                 failure_threshold: int = 5, reset_seconds: float = 30, state_path: Optional[str] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # the file is only needed when there is a limit to share
+        limited = requests_per_minute is not None or tokens_per_minute is not None
+        self.shared_buckets = SharedTokenBuckets(state_path) if state_path and limited else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.lock = threading.Lock()
+
+    # reserves one request and the estimated tokens, returns the seconds to wait if they aren't available yet
+    def reserve(self, estimated_tokens: float) -> float:
+        if self.shared_buckets is not None:
+            return self.shared_buckets.reserve([("requests", self.requests.limit, 1), ("tokens", self.tokens.limit, estimated_tokens)])
+
+        with self.lock:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if wait == 0:
+                self.requests.take(1)
+                self.tokens.take(estimated_tokens)
+            return wait
+
+    # waiting for the lock of the shared buckets could block the event loop while other processes reserve,
+    # so the reservation runs in a thread
+    async def reserve_async(self, estimated_tokens: float) -> float:
+        if self.shared_buckets is not None:
+            return await asyncio.to_thread(self.reserve, estimated_tokens)
+        return self.reserve(estimated_tokens)
+
+    # full jitter exponential backoff, the provider's Retry-After wins if it asks for longer
+    def backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.base_delay))
+        return delay
+
+    # function to decide what to do with a failed call, returns the delay before the next attempt
+    def handle_error(self, error: Exception, attempt: int) -> float:
+        if not is_retryable(error):
+            # the provider did answer, so it counts as up even though the call itself can't succeed
+            if isinstance(error, APIStatusError):
+                self.breaker.record_success()
+            else:
+                self.breaker.release_trial()
+            raise error
+
+        # rate limits only mean the calls have to slow down, they are backed off (honoring Retry-After) but don't
+        # count as failures of the provider, so a burst of 429s doesn't open the circuit
+        rate_limited = isinstance(error, APIStatusError) and error.status_code == 429
+        if rate_limited:
+            self.breaker.release_trial()
+        else:
+            self.breaker.record_failure()
+
+        if attempt >= self.max_retries:
+            raise LLMUnavailableError(f"Model call failed after {attempt + 1} attempts: {error}") from error
+
+        record_retry("rate_limit" if rate_limited else "provider_error")
+        delay = self.backoff(attempt, error)
+        print(f"Model call failed ({error}), retrying in {delay:.1f} seconds")
+        return delay
+
+    async def run_async(self, call, estimated_tokens: float = 0):
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+
+            # a trial call cancelled (or failing to reserve) while it waits for capacity gives its slot back,
+            # otherwise no other trial call would ever be let through
+            try:
+                wait = await self.reserve_async(estimated_tokens)
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = await self.reserve_async(estimated_tokens)
+            except BaseException:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+            try:
+                result = await call()
+                self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            except Exception as e:
+                await asyncio.sleep(self.handle_error(e, attempt))
+                attempt += 1
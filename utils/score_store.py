@@ -0,0 +1,101 @@
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# function to get the key of a resume from its extracted text
+def resume_key(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+# Store of the criteria headers and of the score of every (resume, criterion) pair, kept in SQLite.
+# Scores are stored against the criterion text, so when the criteria change only the new or reworded
+# criteria have to be scored again for a resume that was seen before.
+class ScoreStore:
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS criteria_headers (
+            criterion TEXT PRIMARY KEY,
+            header TEXT NOT NULL
+        )""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS candidates (
+            resume_key TEXT PRIMARY KEY,
+            name TEXT NOT NULL
+        )""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS scores (
+            resume_key TEXT NOT NULL,
+            criterion TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            PRIMARY KEY (resume_key, criterion)
+        )""")
+        # MinHash signatures of the scored resumes and their LSH band keys, used to find near-duplicates across jobs
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS signatures (
+            resume_key TEXT PRIMARY KEY,
+            signature BLOB NOT NULL
+        )""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS signature_bands (
+            band_key TEXT NOT NULL,
+            resume_key TEXT NOT NULL,
+            PRIMARY KEY (band_key, resume_key)
+        )""")
+
+    # returns the stored header of every criterion that has one
+    def get_headers(self, criteria: List[str]) -> Dict[str, str]:
+        with self.lock:
+            return dict(self.connection.execute(
+                f"SELECT criterion, header FROM criteria_headers WHERE criterion IN ({', '.join('?' for _ in criteria)})",
+                criteria
+            ).fetchall())
+
+    def save_headers(self, criteria_headers: Dict[str, str]):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO criteria_headers (criterion, header) VALUES (?, ?)",
+                list(criteria_headers.items())
+            )
+
+    def get_name(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT name FROM candidates WHERE resume_key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    # returns the stored score of every criterion that was already scored for the resume
+    def get_scores(self, key: str, criteria: List[str]) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.connection.execute(
+                f"SELECT criterion, score FROM scores WHERE resume_key = ? AND criterion IN ({', '.join('?' for _ in criteria)})",
+                [key, *criteria]
+            ).fetchall())
+
+    # scores maps a criterion to its score
+    def save_scores(self, key: str, name: str, scores: Dict[str, int]):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.execute("INSERT OR REPLACE INTO candidates (resume_key, name) VALUES (?, ?)", (key, name))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores (resume_key, criterion, score) VALUES (?, ?, ?)",
+                [(key, criterion, score) for criterion, score in scores.items()]
+            )
+            self.connection.execute("COMMIT")
+
+    def save_signature(self, key: str, signature: bytes, band_keys: List[str]):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            self.connection.execute("INSERT OR REPLACE INTO signatures (resume_key, signature) VALUES (?, ?)", (key, signature))
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO signature_bands (band_key, resume_key) VALUES (?, ?)",
+                [(band_key, key) for band_key in band_keys]
+            )
+            self.connection.execute("COMMIT")
+
+    # returns the (resume key, signature) of the stored resumes sharing at least one band key
+    def find_similar(self, band_keys: List[str]) -> List[Tuple[str, bytes]]:
+        with self.lock:
+            return self.connection.execute(
+                f"""SELECT resume_key, signature FROM signatures WHERE resume_key IN (
+                    SELECT resume_key FROM signature_bands WHERE band_key IN ({', '.join('?' for _ in band_keys)})
+                )""",
+                band_keys
+            ).fetchall()
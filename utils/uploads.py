@@ -0,0 +1,136 @@
+import os
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import asyncio
+from typing import List, NamedTuple
+from fastapi import UploadFile
+
+# Uploads are spooled to temporary files in chunks instead of being read into memory, so the parser opens
+# them by path and only one chunk of an upload is held at a time whatever the number or size of the files.
+# A .zip archive of resumes is spooled the same way and its members are streamed out one by one.
+
+max_file_bytes = int(os.getenv("MAX_UPLOAD_FILE_BYTES", 20 * 1024 * 1024))
+max_request_bytes = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 512 * 1024 * 1024))
+chunk_size = 1024 * 1024
+
+# raised when an upload can't be accepted, status_code is the HTTP status to answer with
+class UploadError(Exception):
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class SpooledFile(NamedTuple):
+    filename: str
+    file_ext: str
+    path: str
+    # extraction cache key, the sha256 of the content followed by the extension
+    key: str
+
+# temporary directory holding the spooled files of a single request, removed with cleanup()
+class UploadSpool:
+
+    def __init__(self, allowed_extensions: List[str], max_file_bytes: int = max_file_bytes, max_request_bytes: int = max_request_bytes):
+        self.allowed_extensions = allowed_extensions
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.directory = tempfile.mkdtemp(prefix="resume-ranker-")
+        self.total_bytes = 0
+        self.count = 0
+
+    # files are stored under a generated name, names coming from the client or an archive are never used as paths
+    def new_path(self, file_ext: str) -> str:
+        self.count += 1
+        return os.path.join(self.directory, f"{self.count}{file_ext}")
+
+    # counts the bytes of a file against the per file and per request limits
+    def add_bytes(self, filename: str, file_bytes: int, size: int, limit: int):
+        self.total_bytes += size
+        if file_bytes > limit:
+            raise UploadError(f"{filename} is larger than the limit of {limit} bytes!", 413)
+        if self.total_bytes > self.max_request_bytes:
+            raise UploadError(f"The uploaded files are larger than the limit of {self.max_request_bytes} bytes per request!", 413)
+
+    async def add_upload(self, upload: UploadFile) -> SpooledFile:
+        file_ext = os.path.splitext(upload.filename)[1].lower()
+        path = self.new_path(file_ext)
+        digest = hashlib.sha256()
+        file_bytes = 0
+
+        with open(path, "wb") as spooled:
+            while chunk := await upload.read(chunk_size):
+                file_bytes += len(chunk)
+                self.add_bytes(upload.filename, file_bytes, len(chunk), self.max_file_bytes)
+                digest.update(chunk)
+                spooled.write(chunk)
+
+        return SpooledFile(upload.filename, file_ext, path, f"{digest.hexdigest()}{file_ext}")
+
+    # spools an archive and streams its resumes out, members with other extensions are skipped
+    async def add_archive(self, upload: UploadFile) -> List[SpooledFile]:
+        path = self.new_path(".zip")
+        archive_bytes = 0
+
+        # the archive itself only has to fit in the request limit, its members are checked against both limits
+        with open(path, "wb") as spooled:
+            while chunk := await upload.read(chunk_size):
+                archive_bytes += len(chunk)
+                if archive_bytes > self.max_request_bytes:
+                    raise UploadError(f"{upload.filename} is larger than the limit of {self.max_request_bytes} bytes per request!", 413)
+                spooled.write(chunk)
+
+        try:
+            return await asyncio.to_thread(self.extract_archive, upload.filename, path)
+        finally:
+            os.remove(path)
+
+    def extract_archive(self, archive_name: str, path: str) -> List[SpooledFile]:
+        try:
+            archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise UploadError(f"{archive_name} is not a valid zip archive!")
+
+        files = []
+        with archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                file_ext = os.path.splitext(name)[1].lower()
+
+                # folders, hidden files and macOS metadata aren't resumes
+                if member.is_dir() or not name or name.startswith(".") or member.filename.startswith("__MACOSX/"):
+                    continue
+
+                if file_ext not in self.allowed_extensions:
+                    print(f"Skipping {member.filename} in {archive_name} as it has an invalid extension")
+                    continue
+
+                if member.file_size > self.max_file_bytes:
+                    raise UploadError(f"{member.filename} is larger than the limit of {self.max_file_bytes} bytes!", 413)
+
+                try:
+                    files.append(self.extract_member(archive, member, file_ext))
+                except (RuntimeError, zipfile.BadZipFile, NotImplementedError) as e:
+                    # encrypted or corrupted members are skipped like any other unreadable resume
+                    print(f"Skipping {member.filename} in {archive_name} : {str(e)}")
+
+        return files
+
+    # the declared size of a member can't be trusted, so the limits are enforced on the bytes actually decompressed
+    def extract_member(self, archive: zipfile.ZipFile, member: zipfile.ZipInfo, file_ext: str) -> SpooledFile:
+        path = self.new_path(file_ext)
+        digest = hashlib.sha256()
+        file_bytes = 0
+
+        with archive.open(member) as source, open(path, "wb") as spooled:
+            while chunk := source.read(chunk_size):
+                file_bytes += len(chunk)
+                self.add_bytes(member.filename, file_bytes, len(chunk), self.max_file_bytes)
+                digest.update(chunk)
+                spooled.write(chunk)
+
+        return SpooledFile(member.filename, file_ext, path, f"{digest.hexdigest()}{file_ext}")
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)